@@ -0,0 +1,164 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+
+Benchmark I2Client end to end against a local fake archipel worker, for each
+payload, simulated worker latency and concurrency (number of callers sharing
+one client, each waiting for its output before sending the next input). Each
+scenario runs in a fresh process and reports its throughput, latency
+percentiles, CPU time and peak RSS, to compare releases.
+
+    python benchmarks/client_benchmark.py --payloads text,224,1080p \
+        --latency-ms 0,5 --concurrency 1,8 --requests 200 --json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import fake_archipel
+import numpy as np
+
+from i2_client import I2Client
+from i2_client.stats import percentile
+
+SHAPES = {
+    "224": (224, 224, 3),
+    "1080p": (1080, 1920, 3),
+    "4k": (2160, 3840, 3),
+}
+PAYLOADS = ["text", "dict", *SHAPES]
+
+
+def make_payload(name: str, text_size: int = 1024) -> Tuple[str, Any]:
+    """The data type (used as access key by the fake worker) and one input."""
+
+    if name == "text":
+        return "str", "x" * text_size
+    if name == "dict":
+        return "dict", {"id": 42, "label": "x" * 64, "scores": list(range(100))}
+    array = np.random.randint(0, 255, SHAPES[name], dtype=np.uint8)
+    return "numpy.ndarray", array
+
+
+async def _run(url: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a scenario in the current process."""
+
+    data_type, inp = make_payload(scenario["payload"], scenario["text_size"])
+    concurrency = scenario["concurrency"]
+    latencies: List[float] = []
+    errors = 0
+
+    client = I2Client(
+        url,
+        data_type,
+        max_in_flight=concurrency,
+        batch_size=scenario["batch_size"],
+        codecs=scenario["codecs"],
+        executor=scenario["executor"],
+        transport=scenario["transport"],
+        probe_input=inp,
+    )
+    async with client:
+        remaining = scenario["warmup"]
+
+        async def _caller(record: bool):
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                [(success, _)] = await client.async_inference(inp)
+                if record:
+                    latencies.append(time.perf_counter() - start)
+                    errors += not success
+
+        await asyncio.gather(*[_caller(False) for _ in range(concurrency)])
+
+        remaining = scenario["requests"]
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.gather(*[_caller(True) for _ in range(concurrency)])
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    return {
+        **{k: scenario[k] for k in ["payload", "latency_ms", "concurrency"]},
+        "transport": client.profile,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / wall, 1),
+        "mbps": round(client.stats.bytes_sent / wall / 2**20, 1),
+        **{f"p{q}_ms": round(percentile(latencies, q) * 1000, 2) for q in [50, 95, 99]},
+        "cpu_s": round(cpu, 3),
+        "cpu_per_request_ms": round(cpu / len(latencies) * 1000, 3),
+        "peak_rss_mb": round(client.stats.peak_rss / 2**20),
+    }
+
+
+def run_scenario(url: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a scenario, in a fresh process for a meaningful peak RSS."""
+    return asyncio.run(_run(url, scenario))
+
+
+def main():
+    """Run the benchmark and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--payloads", type=str, default="text,dict,224,1080p")
+    parser.add_argument("--latency-ms", type=str, default="0,5")
+    parser.add_argument("--concurrency", type=str, default="1,8")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--text-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--codecs", type=str, default="raw")
+    parser.add_argument("--executor", type=str, choices=["thread", "process"])
+    parser.add_argument("--transport", type=str, default="default")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    payloads = args.payloads.split(",")
+    unknown = set(payloads) - set(PAYLOADS)
+    if unknown:
+        parser.error(f"Unknown payloads {unknown}, choose among {PAYLOADS}")
+
+    results = []
+    for latency_ms in [float(ms) for ms in args.latency_ms.split(",")]:
+        process, url = fake_archipel.start(latency_ms)
+        try:
+            for payload in payloads:
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    scenario = {
+                        "payload": payload,
+                        "latency_ms": latency_ms,
+                        "concurrency": concurrency,
+                        "requests": args.requests,
+                        "warmup": args.warmup,
+                        "text_size": args.text_size,
+                        "batch_size": args.batch_size,
+                        "codecs": args.codecs.split(",") if args.codecs else [],
+                        "executor": args.executor,
+                        "transport": args.transport,
+                    }
+                    context = multiprocessing.get_context("spawn")
+                    with ProcessPoolExecutor(1, mp_context=context) as executor:
+                        result = executor.submit(run_scenario, url, scenario).result()
+                    results.append(result)
+                    if not args.json:
+                        print(json.dumps(result))
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
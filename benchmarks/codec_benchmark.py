@@ -0,0 +1,113 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+
+Compare the ndarray encode/decode paths: default archipel serialization against
+the raw codec and the JPEG/WebP image codecs. For each frame size, report the time per frame of each direction,
+the message size and the memory allocated per round trip (each full-buffer copy
+allocates a new buffer, so this counts the copies).
+
+    python benchmarks/codec_benchmark.py --repeat 20 --json
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from functools import partial
+
+import archipel_utils as utils
+import msgpack
+import numpy as np
+
+from i2_client.codecs import decode_array, encode_array
+
+SHAPES = {
+    "224": (224, 224, 3),
+    "1080p": (1080, 1920, 3),
+    "4k": (2160, 3840, 3),
+}
+
+PATHS = {
+    "default": (utils.serialize_array, utils.deserialize_array),
+    "raw": (partial(encode_array, codecs=["raw"]), decode_array),
+    "jpeg": (partial(encode_array, codecs=["jpeg"], quality=90), decode_array),
+    "webp": (partial(encode_array, codecs=["webp"], quality=90), decode_array),
+}
+LOSSY = ["jpeg", "webp"]
+
+
+def measure(array: np.ndarray, encode, decode, repeat: int, lossy: bool) -> dict:
+    """Measure one encode/decode path on a given array."""
+
+    def send():
+        return msgpack.packb({"action": "Inference", "data": encode(array)})
+
+    def recv(msg):
+        return decode(msgpack.unpackb(msg)["data"])
+
+    msg = send()
+    if lossy:
+        assert recv(msg).shape == array.shape
+    else:
+        np.testing.assert_array_equal(recv(msg), array)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        send()
+    encode_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        recv(msg)
+    decode_us = (time.perf_counter() - start) / repeat * 1e6
+
+    tracemalloc.start()
+    recv(send())
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "encode_us": round(encode_us, 1),
+        "decode_us": round(decode_us, 1),
+        "message_bytes": len(msg),
+        "allocated_bytes": allocated,
+        "copies": round(allocated / array.nbytes, 2),
+    }
+
+
+def main():
+    """Run the benchmark and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--dtype", type=str, default="uint8")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = []
+    for name, shape in SHAPES.items():
+        array = np.random.randint(0, 255, shape).astype(args.dtype)
+        for path, (encode, decode) in PATHS.items():
+            lossy = path in LOSSY
+            if lossy and array.dtype != np.uint8:
+                continue
+            result = measure(array, encode, decode, args.repeat, lossy)
+            results.append({"frame": name, "path": path, **result})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = ["frame", "path", "encode_us", "decode_us", "message_bytes", "copies"]
+    print("".join(f"{col:>16}" for col in header))
+    for result in results:
+        print("".join(f"{result[col]:>16}" for col in header))
+
+
+if __name__ == "__main__":
+    main()
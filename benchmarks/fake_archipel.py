@@ -0,0 +1,132 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+
+Fake archipel worker for the benchmarks, answering each inference with its
+input after a simulated latency. The access key selects the input/output type
+("str", "dict" or "numpy.ndarray"); batches, codecs and request ids are
+advertised, and requests are processed concurrently.
+
+    python benchmarks/fake_archipel.py --port 8765 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import socket
+import subprocess  # nosec
+import sys
+from contextlib import closing
+from typing import Any, Optional
+
+import msgpack
+from websockets.exceptions import ConnectionClosed
+from websockets.server import serve as ws_serve
+
+FEATURES = {
+    "batch": 64,
+    "codecs": ["raw", "jpeg", "webp", "png"],
+    "request_id": True,
+}
+
+
+async def _answer(websocket, decoded_msg: Any, latency: float):
+    """Answer one inference message after the simulated latency."""
+
+    await asyncio.sleep(latency)
+    if decoded_msg["action"] == "BatchInference":
+        data = [{"status": "Success", "data": inp} for inp in decoded_msg["data"]]
+    else:
+        data = decoded_msg["data"]
+
+    response = {"status": "Success", "data": data}
+    if "id" in decoded_msg:
+        response["id"] = decoded_msg["id"]
+    try:
+        await websocket.send(msgpack.packb(response))
+    except ConnectionClosed:
+        pass
+
+
+async def worker(websocket, path: str, latency: float = 0.0):
+    """Fake worker handling one client connection."""
+
+    registration = msgpack.unpackb(await websocket.recv())
+    data_type = registration["access_key"]
+    types = {"input_type": data_type, "output_type": data_type}
+    await websocket.send(
+        msgpack.packb({"status": "Success", "data": types, "features": FEATURES})
+    )
+
+    tasks = set()
+    async for msg in websocket:
+        task = asyncio.ensure_future(_answer(websocket, msgpack.unpackb(msg), latency))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+async def serve(host: str, port: int, latency: float):
+    """Run the fake worker until cancelled."""
+
+    async def _worker(websocket, path):
+        await worker(websocket, path, latency)
+
+    async with ws_serve(_worker, host, port, max_size=2**50):
+        print("ready", flush=True)
+        await asyncio.Future()
+
+
+def available_port() -> int:
+    """Return an available port on host."""
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def start(latency_ms: float = 0.0, port: Optional[int] = None) -> tuple:
+    """Start the fake worker in another process, so it does not skew measures.
+
+    Returns:
+        The process (to terminate) and the url of the worker.
+    """
+
+    port = available_port() if port is None else port
+    process = subprocess.Popen(  # nosec
+        [
+            sys.executable,
+            __file__,
+            "--port",
+            str(port),
+            "--latency-ms",
+            str(latency_ms),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    if process.stdout.readline().strip() != "ready":  # type: ignore
+        process.terminate()
+        raise RuntimeError("Fake archipel worker failed to start")
+
+    return process, f"ws://127.0.0.1:{port}"
+
+
+def main():
+    """Run the fake worker."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+
+Measure the import time of the client and of the CLI startup, with
+`python -X importtime` in fresh interpreters, and list the heaviest imported
+packages. With --max-ms, exit with an error if an entry is over budget.
+
+    python benchmarks/import_benchmark.py --repeat 5 --max-ms 300
+"""
+
+import argparse
+import json
+import statistics
+import subprocess  # nosec
+import sys
+from typing import Dict
+
+ENTRIES = {
+    "import i2_client": "import i2_client",
+    "from i2_client import I2Client": "from i2_client import I2Client",
+    "i2py --help": (
+        "import sys; sys.argv = ['i2py', '--help']\n"
+        + "from i2_client import i2_cli\n"
+        + "try:\n    i2_cli()\nexcept SystemExit:\n    pass"
+    ),
+}
+
+
+def import_times(code: str) -> Dict[str, int]:
+    """Cumulative import time (us) of each top-level package imported by code."""
+
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        if not name.startswith("  "):  # top-level import of the statement
+            package = name.strip().split(".")[0]
+            times[package] = times.get(package, 0) + int(cumulative)
+    return times
+
+
+def main():
+    """Run the benchmark and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages shown")
+    parser.add_argument("--max-ms", type=float, help="fail above this median time")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = []
+    for entry, code in ENTRIES.items():
+        runs = [import_times(code) for _ in range(args.repeat)]
+        # the interpreter startup (site) is paid anyway, not counted
+        totals = [sum(t for p, t in run.items() if p != "site") for run in runs]
+        heaviest = sorted(
+            [item for item in runs[-1].items() if item[0] != "site"],
+            key=lambda item: -item[1],
+        )
+        results.append(
+            {
+                "entry": entry,
+                "median_ms": round(statistics.median(totals) / 1000, 1),
+                "heaviest": {p: round(t / 1000, 1) for p, t in heaviest[: args.top]},
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            heaviest = ", ".join(f"{p} {t}ms" for p, t in result["heaviest"].items())
+            print(f"{result['entry']:>32}: {result['median_ms']:>7}ms  ({heaviest})")
+
+    if args.max_ms is not None:
+        slow = [r["entry"] for r in results if r["median_ms"] > args.max_ms]
+        if slow:
+            sys.exit(f"Over the {args.max_ms}ms budget: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    main()
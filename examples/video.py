@@ -8,18 +8,16 @@ permission, please contact the copyright holders and delete this file.
 """
 
 import argparse
-import asyncio
 from pathlib import Path
 
-import cv2
-
-from i2_client import I2Client
+from i2_client import process_video
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--url", type=str, help="", required=True)
 parser.add_argument("--access_uuid", type=str, help="", required=True)
 parser.add_argument("--video_path", type=str, help="", required=True)
 parser.add_argument("--save_path", type=str, help="", default=None)
+parser.add_argument("--max_in_flight", type=int, help="", default=8)
 args = parser.parse_args()
 
 # Check arguments
@@ -31,67 +29,32 @@ if not path.is_file():
 valid_suffixes = [".mp4"]
 if path.suffix not in valid_suffixes:
     raise TypeError(
-        "The video has an suffix. Valid suffixes: {' ,'.join(valid_suffixes)}"
+        f"The video has an invalid suffix. Valid suffixes: {', '.join(valid_suffixes)}"
     )
 
 if args.save_path is None:
     save_path = path.parent / f"{path.stem}_processed.mp4"
 else:
-    save_path = Path(args.save)
+    save_path = Path(args.save_path)
     if save_path.is_file():
         raise FileExistsError("The save path is already exist")
 
-# Main function
-
-
-async def main():
-    """Main async function."""
-
-    async with I2Client(args.url, args.access_uuid) as client:
-        # Start video reader
-        cap = cv2.VideoCapture(str(path))
-        if not cap.isOpened():
-            raise ValueError("Error opening video")
-
-        # Make the first inference to get inference output size
-        ok, frame = cap.read()
-        if not ok:
-            raise ValueError("Error reading video")
-
-        outputs = await client.async_inference(frame)
-
-        # Start video writer
-        fourcc = cv2.VideoWriter_fourcc(*"MP4V")
-        fps = 25
-        output_shape = (outputs[0].shape[0], outputs[0].shape[1])
-        out = cv2.VideoWriter(str(save_path), fourcc, fps, output_shape)
-
-        out.write(outputs[0])
-        count = 1
-
-        # Inference until video is completly processed
-        while True:
-            ok, frame = cap.read()
-            if not ok:
-                # End of the video
-                break
-
-            outputs = await client.async_inference(frame)
-
-            success, output = outputs[0]
-            if not success:
-                raise RuntimeError(output)
-            out.write(output)
-
-            count += 1
-            if not bool(count % 25):
-                print(f"processed {count} frames")
 
-        # Release reader and writer
-        cap.release()
-        out.release()
+def on_frame(count, info):
+    """Print the progress."""
+    if not bool(count % 25):
+        print(f"processed {count}/{info.frames} frames")
 
-        print(f"processed video saved at: {save_path}")
 
+# Decode, infer (up to max_in_flight frames at once) and encode in a pipeline, the
+# processed video keeps the frame rate and resolution of the source
+info = process_video(
+    path,
+    save_path,
+    args.url,
+    args.access_uuid,
+    max_in_flight=args.max_in_flight,
+    on_frame=on_frame,
+)
 
-asyncio.run(main())
+print(f"processed video ({info.frames} frames) saved at: {save_path}")
@@ -9,7 +9,6 @@ permission, please contact the copyright holders and delete this file.
 
 import argparse
 import asyncio
-import time
 import warnings
 
 import cv2
@@ -18,7 +17,7 @@ import numpy as np
 from rich.live import Live
 from rich.spinner import Spinner
 
-from i2_client import I2Client
+from i2_client import I2Client, LiveSource
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--url", type=str, help="", required=True)
@@ -28,6 +27,9 @@ parser.add_argument("--resize_width", type=int, help="", default=None)  # DEPRAC
 parser.add_argument("--access-key", type=str, help="")
 parser.add_argument("--frame-rate", type=int, help="", default=15)
 parser.add_argument("--resize-width", type=int, help="", default=None)
+parser.add_argument("--codec", type=str, help="jpeg, webp or png", default=None)
+parser.add_argument("--quality", type=int, help="jpeg/webp quality", default=90)
+parser.add_argument("--no-adaptive", action="store_true", help="keep the frame rate")
 parser.add_argument("--debug", action="store_true")
 args = parser.parse_args()
 
@@ -42,58 +44,75 @@ async def main():
     """Main async function."""
 
     cam = cv2.VideoCapture(0)
-    prev = 0
-
-    async with I2Client(args.url, args.access_key, args.debug) as client:
-
-        spinner = Spinner("dots2", "connecting...")
-        with Live(spinner, refresh_per_second=20):
-
-            durations = []
-
-            while True:
-
-                # 1. get webcam frame
-
-                time_elapsed = time.time() - prev
-                check, frame = cam.read()
-                if time_elapsed < 1.0 / args.frame_rate:
-                    # force the webcam frame rate so the bottleneck is the
-                    # inference, not the camera performance.
-                    continue
-                prev = time.time()
-
-                if args.resize_width is not None:
-                    frame = imutils.resize(frame, width=args.resize_width)
-
-                # 2. inference
-
-                start = time.time()
-                outputs = await client.async_inference(frame)
-                durations.append(time.time() - start)
-
-                # 3. show
-
-                spinner.text = (
-                    f"send + infer + receive: {durations[-1]:.4f} secs "
-                    + f"(mean: {np.mean(durations):.4f}, std: {np.std(durations):.4f}, "
-                    + f"min: {np.min(durations):.4f}, max: {np.max(durations):.4f})"
-                )
-
-                success, output = outputs[0]
-                if not success:
-                    raise RuntimeError(output)
-                h, w, _ = frame.shape
-                frame = cv2.resize(frame, (w * 2, h * 2))
-                output = cv2.resize(output, (w * 2, h * 2))
-                concatenate_imgs = np.concatenate((frame, output), axis=1)
-                cv2.imshow("original / inference ", concatenate_imgs)
-                key = cv2.waitKey(1)
-                if key == 27:
-                    break
-
-        cam.release()
-        cv2.destroyAllWindows()
+    # keep only the newest camera frame, so a lower frame rate does not read old ones
+    cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    codecs = ("raw",) if args.codec is None else (args.codec, "raw")
+    client = I2Client(
+        args.url,
+        args.access_key,
+        args.debug,
+        codecs=codecs,
+        image_quality=args.quality,
+    )
+
+    def read():
+        """Capture a webcam frame, in the capture thread."""
+
+        check, frame = cam.read()
+        if check and args.resize_width is not None:
+            frame = imutils.resize(frame, width=args.resize_width)
+        return check, frame
+
+    def display(frame, result):
+        """Show a frame and its output, in the display thread."""
+
+        success, output = result
+        if not success:
+            raise RuntimeError(output)
+
+        h, w, _ = frame.shape
+        frame = cv2.resize(frame, (w * 2, h * 2))
+        output = cv2.resize(output, (w * 2, h * 2))
+        concatenate_imgs = np.concatenate((frame, output), axis=1)
+        cv2.imshow("original / inference ", concatenate_imgs)
+        return cv2.waitKey(1) != 27
+
+    # frames are captured in a thread, paced by sleeping (at most --frame-rate fps,
+    # lowered to the inference rate unless --no-adaptive) and sent latest-frame-wins,
+    # outputs are shown in another thread
+    source = LiveSource(
+        client, read, display, max_fps=args.frame_rate, adaptive=not args.no_adaptive
+    )
+
+    async def report():
+        """Show the stats twice per second, from the event loop which records them."""
+
+        while True:
+            await asyncio.sleep(0.5)
+            stream = source.stream
+            if stream is None or not client.stats.requests:
+                continue
+            summary = client.stats.summary()
+            spinner.text = " | ".join(
+                f"{phase}: {summary[phase]['p50'] * 1000:.1f} ms"
+                for phase in ["encode", "send", "wait", "decode", "total"]
+            ) + (
+                f" (latency: {stream.latency * 1000:.1f} ms, {source.fps:.1f} fps, "
+                + f"dropped: {stream.dropped}/{stream.submitted} frames, "
+                + f"sent: {summary['bytes_sent']['mean'] / 1e3:.0f} kB/frame)"
+            )
+
+    spinner = Spinner("dots2", "connecting...")
+    async with client:
+        with Live(spinner, refresh_per_second=4):
+            reporter = asyncio.ensure_future(report())
+            try:
+                await source.run()
+            finally:
+                reporter.cancel()
+                cam.release()
+                cv2.destroyAllWindows()
 
 
 asyncio.run(main())
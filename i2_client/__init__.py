@@ -7,9 +7,59 @@ permission of the copyright holders. If you encounter this file and do not have
 permission, please contact the copyright holders and delete this file.
 """
 
-from .cli import create_cli
-from .client import I2Client  # noqa
+import importlib
+from typing import TYPE_CHECKING, Any, List
 
 __version__ = "0.4.0"
 
-i2_cli = create_cli()
+# public names and their submodule, only imported when first accessed (PEP 562),
+# so `import i2_client` does not pay for the dependencies of the unused ones
+_LAZY = {
+    "I2Client": "client",
+    "I2ClientPool": "pool",
+    "HedgedClient": "hedge",
+    "LiveSource": "live",
+    "MicroBatcher": "batcher",
+    "BufferPool": "buffers",
+    "DiskCache": "cache",
+    "ResultCache": "cache",
+    "RealtimeStream": "realtime",
+    "TokenBucket": "scheduler",
+    "process_video": "video",
+}
+
+__all__ = [*_LAZY, "i2_cli"]
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .batcher import MicroBatcher  # noqa
+    from .buffers import BufferPool  # noqa
+    from .cache import DiskCache, ResultCache  # noqa
+    from .client import I2Client  # noqa
+    from .hedge import HedgedClient  # noqa
+    from .live import LiveSource  # noqa
+    from .pool import I2ClientPool  # noqa
+    from .realtime import RealtimeStream  # noqa
+    from .scheduler import TokenBucket  # noqa
+    from .video import process_video  # noqa
+
+
+def __getattr__(name: str) -> Any:
+    """Import the public names on first access."""
+
+    if name == "i2_cli":
+        from .cli import create_cli
+
+        value = create_cli()
+    elif name in _LAZY:
+        module = importlib.import_module(f".{_LAZY[name]}", __name__)
+        value = getattr(module, name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    """Names of the module, including the ones not imported yet."""
+    return sorted([*globals(), *__all__])
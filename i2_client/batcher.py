@@ -0,0 +1,234 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Set, Tuple, Union
+
+from .client import I2Client
+from .pool import I2ClientPool
+
+log = logging.getLogger(__name__)
+
+_Item = Tuple[Any, asyncio.Future]
+
+
+class MicroBatcher:
+    """Group the single inferences of concurrent callers in batches.
+
+    Calls arriving while a batch is being processed are collected for at most
+    `max_wait_ms`, or until `max_batch_size` inputs, then sent together with
+    one `async_inference`. When no batch is being processed, calls are sent
+    right away, so a lightly loaded batcher does not add latency.
+    """
+
+    def __init__(
+        self,
+        client: Union[I2Client, I2ClientPool],
+        max_wait_ms: float = 5.0,
+        max_batch_size: int = 32,
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+    ):
+        """Initialize the micro-batcher.
+
+        Args:
+            client: Connected client or pool used to send the batches.
+            max_wait_ms: Optional; Maximum time a call waits for others to join
+                its batch, in milliseconds.
+            max_batch_size: Optional; Maximum number of inputs of a batch. The
+                client still sends them in messages of its own batch size.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid wait or batch size.
+        """
+
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms must be positive, got {max_wait_ms}")
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+
+        self.client = client
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.encode = encode
+        self.decode = decode
+
+        # number of batches sent and of inputs in them, for the mean batch size
+        self.batches = 0
+        self.inputs = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Future] = set()
+
+    async def __aenter__(self):
+        """Async context manager enter.
+
+        Args:
+            None.
+
+        Returns:
+            The micro-batcher.
+
+        Raises:
+            None.
+        """
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        """Async context manager exit, see `close`.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        await self.close()
+
+    async def infer(self, inp: Any) -> Tuple[bool, Any]:
+        """Send one input for inference, batched with the concurrent calls.
+
+        Args:
+            inp: The input to send to the worker.
+
+        Returns:
+            Tuple composed of two values: bool to indicate whether inference is a
+            success and the inference is success or an error message if fail.
+
+        Raises:
+            ValueError: There was an error encoding or packing the input.
+            ConnectionError: The connection was lost before the output was
+                received.
+            RuntimeError: The micro-batcher was closed before sending the input.
+        """
+
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.ensure_future(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((inp, future))  # type: ignore
+        return await future
+
+    async def close(self):
+        """Stop collecting calls, and wait for the batches being processed.
+
+        Calls not sent yet fail with a RuntimeError.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _collect(self):
+        """Collect the calls in batches, and send them."""
+
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        batch: List[_Item] = []
+
+        try:
+            while True:
+                batch = [await queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not queue.empty():
+                        batch.append(queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if not self._sending or timeout <= 0:
+                        break  # nothing to wait for, or waited enough
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                task = asyncio.ensure_future(self._send(batch))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+                batch = []
+        finally:
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Micro-batcher closed"))
+
+    async def _send(self, batch: List[_Item]):
+        """Send a batch and route its outputs to the callers."""
+
+        batch = [(inp, future) for inp, future in batch if not future.done()]
+        if not batch:
+            return  # all callers cancelled
+
+        self.batches += 1
+        self.inputs += len(batch)
+        log.debug(f"Send a batch of {len(batch)} input(s)")
+
+        try:
+            outputs = await self.client.async_inference(
+                [inp for inp, _ in batch], self.encode, self.decode
+            )
+        except ValueError as error:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(error)
+                return
+            # an input can not be encoded or packed: send them one by one, so
+            # only its caller gets the error (the valid ones may be sent twice)
+            log.debug(f"Batch failed ({error}), send its inputs one by one")
+            await asyncio.gather(
+                *[self._send_one(inp, future) for inp, future in batch]
+            )
+            return
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    async def _send_one(self, inp: Any, future: asyncio.Future):
+        """Send a single input of a failed batch, and route its output."""
+
+        try:
+            [output] = await self.client.async_inference(
+                [inp], self.encode, self.decode
+            )
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+            return
+
+        if not future.done():
+            future.set_result(output)
@@ -0,0 +1,215 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .client import I2Client
+from .stats import percentile
+
+log = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class BenchResult:
+    """Latencies and errors of a load test."""
+
+    def __init__(self):
+        self.latencies: List[float] = []  # of the successful requests, in seconds
+        self.errors: Counter = Counter()  # number of failed requests by message
+        self.duration = 0.0
+
+    @property
+    def requests(self) -> int:
+        """Number of completed requests, successful or not."""
+        return len(self.latencies) + sum(self.errors.values())
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second."""
+        return self.requests / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        """Fraction of failed requests."""
+        return sum(self.errors.values()) / self.requests if self.requests else 0.0
+
+    def histogram(self, buckets: int = 10) -> List[Tuple[float, float, int]]:
+        """Count latencies in logarithmic buckets.
+
+        Args:
+            buckets: Optional; Number of buckets, between the min and max latency.
+
+        Returns:
+            The lower and upper bounds (in seconds) and count of each bucket.
+
+        Raises:
+            None.
+        """
+
+        if not self.latencies:
+            return []
+
+        low, high = min(self.latencies), max(self.latencies)
+        if high <= low * 1.001:
+            return [(low, high, len(self.latencies))]
+
+        ratio = (high / low) ** (1 / buckets)
+        edges = [low * ratio**i for i in range(buckets)] + [high]
+        counts = [0] * buckets
+        for latency in self.latencies:
+            index = int(math.log(latency / low) / math.log(ratio))
+            counts[min(index, buckets - 1)] += 1
+
+        return [(edges[i], edges[i + 1], counts[i]) for i in range(buckets)]
+
+    def summary(self, percentiles: Sequence[float] = PERCENTILES) -> Dict[str, Any]:
+        """Summarize the load test.
+
+        Args:
+            percentiles: Optional; Latency percentiles to compute.
+
+        Returns:
+            Requests, errors, throughput and latencies (in milliseconds).
+
+        Raises:
+            None.
+        """
+
+        latencies = {f"p{q:g}": percentile(self.latencies, q) for q in percentiles}
+        latencies["max"] = max(self.latencies, default=0.0)
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "error_rate": round(self.error_rate, 4),
+            "duration_s": round(self.duration, 3),
+            "throughput": round(self.throughput, 2),
+            "latency_ms": {k: round(v * 1000, 3) for k, v in latencies.items()},
+        }
+
+    def report(self) -> str:
+        """Text report: histogram, percentiles, error rate and throughput."""
+
+        lines = ["Latency histogram (ms):"]
+        histogram = self.histogram()
+        top = max([count for _, _, count in histogram], default=0)
+        for low, high, count in histogram:
+            bar = "#" * round(40 * count / top) if top else ""
+            lines.append(f"  {low * 1000:10.3f} - {high * 1000:10.3f} | {bar} {count}")
+
+        summary = self.summary()
+        lines.append("Latency percentiles (ms):")
+        for name, value in summary["latency_ms"].items():
+            lines.append(f"  {name:>6}: {value:10.3f}")
+
+        lines.append(
+            f"Requests: {self.requests} in {self.duration:.1f}s, "
+            + f"throughput: {self.throughput:.1f} req/s, "
+            + f"errors: {100 * self.error_rate:.2f}%"
+        )
+        for message, count in self.errors.most_common(5):
+            lines.append(f"  {count} x {message}")
+
+        return "\n".join(lines)
+
+
+async def run_bench(
+    client: I2Client,
+    inp: Any,
+    concurrency: int = 1,
+    rate: Optional[float] = None,
+    duration: float = 10.0,
+    warmup: float = 1.0,
+) -> BenchResult:
+    """Load test a model with the same input.
+
+    In closed loop (the default), `concurrency` callers send the input as soon
+    as they get the output of the previous one. With a target `rate`, inputs
+    are sent on a fixed schedule with at most `concurrency` pending, and the
+    latency counts from the scheduled time, so a saturated model is not hidden
+    by the requests it delays.
+
+    Args:
+        client: Connected client to load.
+        inp: The input to send.
+        concurrency: Optional; Number of concurrent requests.
+        rate: Optional; Target requests per second (open loop).
+        duration: Optional; Duration of the measure, in seconds.
+        warmup: Optional; Duration before the measure, not recorded, in seconds.
+
+    Returns:
+        The latencies and errors of the requests completed during the measure.
+
+    Raises:
+        ValueError: Invalid concurrency or rate.
+        ConnectionError: The connection was lost.
+    """
+
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    if rate is not None and rate <= 0:
+        raise ValueError(f"rate must be positive, got {rate}")
+
+    result = BenchResult()
+    start = time.perf_counter()
+    measure_start = start + warmup
+    end = measure_start + duration
+
+    async def _request(scheduled: float):
+        try:
+            [(success, output)] = await client.async_inference(inp)
+        except ValueError as error:
+            success, output = False, str(error)
+        done = time.perf_counter()
+        if scheduled < measure_start or done > end:
+            return
+        if success:
+            result.latencies.append(done - scheduled)
+        else:
+            result.errors[str(output)[:100]] += 1
+
+    if rate is None:
+
+        async def _caller():
+            while time.perf_counter() < end:
+                await _request(time.perf_counter())
+
+        await asyncio.gather(*[_caller() for _ in range(concurrency)])
+
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        async def _scheduled(scheduled: float):
+            try:
+                await _request(scheduled)
+            finally:
+                slots.release()
+
+        try:
+            for index in range(math.ceil((warmup + duration) * rate)):
+                scheduled = start + index / rate
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                await slots.acquire()
+                task = asyncio.ensure_future(_scheduled(scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    result.duration = min(time.perf_counter(), end) - measure_start
+    log.debug(f"Load test done: {result.summary()}")
+    return result
@@ -0,0 +1,95 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class BufferPool:
+    """Recycled arrays to decode outputs into, instead of allocating new ones.
+
+    Arrays are acquired by the decoding, and handed back with `release` once
+    the caller is done with them. It can be used from several threads.
+    """
+
+    def __init__(self, max_free: int = 4):
+        """Initialize the pool.
+
+        Args:
+            max_free: Optional; Maximum number of released arrays kept per shape
+                and dtype, the others are freed.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.max_free = max_free
+        self._free: Dict[Tuple, List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+        self.allocations = 0  # arrays allocated by the pool
+        self.reuses = 0  # arrays acquired from the released ones
+        self.bytes = 0  # size of the arrays acquired and not freed
+        self.peak_bytes = 0
+
+    def acquire(self, shape: Sequence[int], dtype: np.dtype) -> np.ndarray:
+        """Get an array, recycled if one of the same shape and dtype is free.
+
+        Args:
+            shape: Shape of the array.
+            dtype: Data type of the array.
+
+        Returns:
+            An array with undefined content.
+
+        Raises:
+            None.
+        """
+
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.reuses += 1
+                return free.pop()
+
+            array = np.empty(key[0], dtype=key[1])
+            self.allocations += 1
+            self.bytes += array.nbytes
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+            return array
+
+    def release(self, array: np.ndarray):
+        """Hand back an array acquired from the pool.
+
+        Args:
+            array: The array, which must not be used anymore.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: The array does not own its memory, so it is not from a pool.
+        """
+
+        if array.base is not None:
+            raise ValueError("Only arrays acquired from the pool can be released")
+
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(array)
+            else:
+                self.bytes -= array.nbytes
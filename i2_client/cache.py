@@ -0,0 +1,379 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+import msgpack
+import numpy as np
+
+try:
+    import xxhash
+
+    XXHASH_AVAILABLE = True
+except ModuleNotFoundError:
+    XXHASH_AVAILABLE = False
+
+try:
+    import fcntl
+
+    FCNTL_AVAILABLE = True
+except ModuleNotFoundError:  # pragma: no cover
+    FCNTL_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+
+def _hash_update(hasher: Any, obj: Any):
+    """Feed an encoded input to a hash, its buffers without copying them."""
+
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        hasher.update(b"b%d:" % len(obj))
+        hasher.update(obj)
+    elif isinstance(obj, dict):
+        hasher.update(b"d%d:" % len(obj))
+        for key, value in obj.items():
+            _hash_update(hasher, key)
+            _hash_update(hasher, value)
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(b"l%d:" % len(obj))
+        for value in obj:
+            _hash_update(hasher, value)
+    else:
+        try:
+            hasher.update(msgpack.packb(obj))
+        except Exception as error:
+            raise ValueError(f"Fail to msgpack input: {error}")
+
+
+def input_key(url: str, payload: Any, scope: str = "") -> str:
+    """Hash an encoded input for a given model.
+
+    Uses xxhash if available, blake2b otherwise. Buffers (like the `raw` codec
+    data) are hashed in place, the other values as packed by msgpack, so the
+    input is not packed just to be hashed.
+
+    Args:
+        url: Url of the model.
+        payload: The encoded input.
+        scope: Optional; Access key (or any other scope) the output depends on.
+
+    Returns:
+        The hex digest identifying the input for this model.
+
+    Raises:
+        ValueError: The input can not be packed.
+    """
+
+    if XXHASH_AVAILABLE:
+        hasher = xxhash.xxh3_128()
+    else:
+        hasher = hashlib.blake2b(digest_size=16)
+    for part in [url, scope]:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    _hash_update(hasher, payload)
+    return hasher.hexdigest()
+
+
+def payload_size(obj: Any) -> int:
+    """Approximate size in bytes of a msgpack decoded object."""
+
+    if isinstance(obj, (bytes, bytearray, memoryview, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(payload_size(item) for item in obj)
+    return 8
+
+
+class ResultCache:
+    """In-memory cache of worker responses, with LRU eviction.
+
+    Responses are stored as received (before decoding), keyed by `input_key`.
+    Eviction happens as soon as the number of entries or their total size
+    exceeds the limits.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 256 * 2**20):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Optional; Maximum number of cached responses.
+            max_bytes: Optional; Maximum total size of cached responses.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """Number of cached responses."""
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached response and mark it as recently used.
+
+        Args:
+            key: Key of the input.
+
+        Returns:
+            The cached response, or None if not cached.
+
+        Raises:
+            None.
+        """
+
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: str, value: Any):
+        """Cache a response, evicting the least recently used ones if needed.
+
+        Responses larger than the cache are not cached.
+
+        Args:
+            key: Key of the input.
+            value: The response to cache.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        size = payload_size(value)
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+
+        if key in self._entries:
+            self.size -= self._sizes.pop(key)
+            del self._entries[key]
+
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.size += size
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            evicted, _ = self._entries.popitem(last=False)
+            self.size -= self._sizes.pop(evicted)
+            self.evictions += 1
+
+
+def _raw_array(response: Any) -> Optional[dict]:
+    """The raw codec array of a successful response, if any."""
+
+    if not isinstance(response, dict) or not isinstance(response.get("data"), dict):
+        return None
+    data = response["data"]
+    if data.get("codec") != "raw" or not data.get("shape") or not data.get("data"):
+        return None
+    return data
+
+
+class DiskCache:
+    """On-disk cache of worker responses, shared by processes and invocations.
+
+    Each response is stored in a msgpack file named after its key. The arrays
+    of the raw codec are stored next to it as `.npy` files, memory-mapped when
+    read so large outputs are only loaded when accessed. Files are written to
+    a temporary file then renamed, so concurrent readers never see a partial
+    entry. When the directory grows over `max_bytes`, the least recently used
+    entries are removed, by one process at a time.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = 2**30):
+        """Initialize the cache, creating its directory if needed.
+
+        Args:
+            directory: Directory of the cache, can be shared by several processes.
+            max_bytes: Optional; Maximum total size of the cache. It is checked
+                by each process against its own writes since the last eviction,
+                so it can be exceeded by the writes of the other processes until
+                the next eviction.
+
+        Returns:
+            None.
+
+        Raises:
+            OSError: The directory can not be created.
+        """
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key: str, suffix: str) -> Path:
+        """Path of a file of an entry, in a subdirectory per key prefix."""
+        return self.directory / key[:2] / f"{key}{suffix}"
+
+    def _entries(self) -> List[Tuple[float, str, int]]:
+        """Last access time, key and size of each entry."""
+
+        entries = []
+        for path in self.directory.glob("*/*.msgpack"):
+            try:
+                stat = path.stat()
+                size = stat.st_size
+                array_path = path.with_suffix(".npy")
+                if array_path.exists():
+                    size += array_path.stat().st_size
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, path.stem, size))
+        return entries
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Lock the cache directory against the other processes."""
+
+        if not FCNTL_AVAILABLE:  # pragma: no cover
+            yield
+            return
+
+        with open(self.directory / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, path: Path, write: Any):
+        """Write a file atomically, through a temporary file."""
+
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def __len__(self):
+        """Number of cached responses."""
+        return len(self._entries())
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached response and mark it as recently used.
+
+        Args:
+            key: Key of the input.
+
+        Returns:
+            The cached response, or None if not cached.
+
+        Raises:
+            None.
+        """
+
+        path = self._path(key, ".msgpack")
+        try:
+            with open(path, "rb") as f:
+                response = msgpack.unpackb(f.read(), strict_map_key=False)
+            if response.pop("npy", False):
+                array = np.load(self._path(key, ".npy"), mmap_mode="r")
+                response["data"]["data"] = memoryview(array).cast("B")
+            os.utime(path)
+        except (OSError, ValueError) as error:
+            if not isinstance(error, FileNotFoundError):
+                log.debug(f"Invalid cache entry {key}: {error}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return response
+
+    def put(self, key: str, value: Any):
+        """Cache a response, evicting the least recently used ones if needed.
+
+        Responses larger than the cache are not cached.
+
+        Args:
+            key: Key of the input.
+            value: The response to cache.
+
+        Returns:
+            None.
+
+        Raises:
+            OSError: The response can not be written.
+        """
+
+        if payload_size(value) > self.max_bytes:
+            return
+
+        size = 0
+        raw = _raw_array(value)
+        if raw is not None:
+            array = np.frombuffer(raw["data"], dtype=np.dtype(raw["dtype"]))
+            array = array.reshape(tuple(raw["shape"]))
+            self._write(self._path(key, ".npy"), lambda f: np.save(f, array))
+            size += array.nbytes
+            value = {**value, "data": {**raw, "data": b""}, "npy": True}
+
+        # written last, so the entry is complete once it exists
+        packed = msgpack.packb(value)
+        self._write(self._path(key, ".msgpack"), lambda f: f.write(packed))
+        size += len(packed)
+
+        self.size += size
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries, down to 90% of `max_bytes`."""
+
+        with self._lock():
+            entries = sorted(self._entries())
+            self.size = sum(size for _, _, size in entries)
+            for _, key, size in entries:
+                if self.size <= 0.9 * self.max_bytes:
+                    break
+                for suffix in [".msgpack", ".npy"]:
+                    try:
+                        os.unlink(self._path(key, suffix))
+                    except FileNotFoundError:
+                        pass
+                self.size -= size
+                self.evictions += 1
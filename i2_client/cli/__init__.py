@@ -7,22 +7,52 @@ permission of the copyright holders. If you encounter this file and do not have
 permission, please contact the copyright holders and delete this file.
 """
 
+import importlib
 import logging
+from typing import Dict, List, Optional
 
 import click
-from rich.logging import RichHandler
 
-from .build import build, test
-from .client import infer
+# sub commands and the module defining them, only imported when used (or listed
+# by --help), so each command only pays for its own dependencies (like docker)
+COMMANDS = {
+    "build": "i2_client.cli.build",
+    "test": "i2_client.cli.build",
+    "infer": "i2_client.cli.client",
+    "bench": "i2_client.cli.client",
+    "video": "i2_client.cli.client",
+}
+
+
+class LazyGroup(click.Group):
+    """Group of commands importing their module on first use."""
+
+    def __init__(self, *args, lazy_commands: Optional[Dict[str, str]] = None, **kw):
+        super().__init__(*args, **kw)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        """Names of all commands, without importing them."""
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        """Get a command, importing its module if needed."""
+
+        if name in self.lazy_commands:
+            module = importlib.import_module(self.lazy_commands[name])
+            return getattr(module, name)
+        return super().get_command(ctx, name)
 
 
 def create_cli():
     """Create CLI with all sub commands."""
 
-    @click.group()
+    @click.group(cls=LazyGroup, lazy_commands=COMMANDS)
     def archipel_client_cli():
         """Command line interface for isquare."""
 
+        from rich.logging import RichHandler
+
         rich_handler = RichHandler(
             show_path=False,
             omit_repeated_times=False,
@@ -37,8 +67,4 @@ def create_cli():
         for package in ["docker", "urllib3", "websockets"]:
             logging.getLogger(package).propagate = False
 
-    archipel_client_cli.add_command(build)
-    archipel_client_cli.add_command(test)
-    archipel_client_cli.add_command(infer)
-
     return archipel_client_cli
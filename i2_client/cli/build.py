@@ -9,8 +9,6 @@ permission, please contact the copyright holders and delete this file.
 
 import click
 
-from i2_client.build import BuildManager
-
 
 @click.command()
 @click.argument("script", type=click.Path(exists=True), required=True)
@@ -53,6 +51,8 @@ from i2_client.build import BuildManager
 )
 def build(script, dockerfile, build_args, tag, cpu, no_cache, debug):
     """Build an docker image ready for isquare."""
+    from i2_client.build import BuildManager
+
     BuildManager(debug).build_task(script, dockerfile, build_args, tag, cpu, no_cache)
 
 
@@ -65,4 +65,6 @@ def build(script, dockerfile, build_args, tag, cpu, no_cache, debug):
 )
 def test(tag, debug):
     """Verify that an docker image matches the isquare standard."""
+    from i2_client.build import BuildManager
+
     BuildManager(debug=debug).verify_task(tag)
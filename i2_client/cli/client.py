@@ -9,9 +9,7 @@ permission, please contact the copyright holders and delete this file.
 
 
 import click
-import numpy as np
 
-from i2_client.client import I2Client
 from i2_client.utils import open_file, save_file
 
 
@@ -28,15 +26,38 @@ from i2_client.utils import open_file, save_file
 @click.option(
     "--save-path", type=str, help="Path to save your data (img, txt or json)."
 )
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="Directory caching the outputs, reused if the same data is sent again.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=1024,
+    show_default=True,
+    help="Maximum size of the cache directory, in MB.",
+)
 @click.option(
     "--debug",
     is_flag=True,
     help="Increase logging verbosity level to debug",
 )
-def infer(data, url, access_key, save_path, debug):  # pragma: no cover
+def infer(
+    data, url, access_key, save_path, cache_dir, cache_size, debug
+):  # pragma: no cover
     """Send data for inference."""
 
-    client = I2Client(url, access_key, debug)
+    import numpy as np
+
+    from i2_client.cache import DiskCache
+    from i2_client.client import I2Client
+
+    cache = None
+    if cache_dir is not None:
+        cache = DiskCache(cache_dir, max_bytes=cache_size * 2**20)
+
+    client = I2Client(url, access_key, debug, cache=cache)
 
     content = open_file(data)
     output = client.inference(content)
@@ -53,3 +74,179 @@ def infer(data, url, access_key, save_path, debug):  # pragma: no cover
                 cv2.imshow(output)
             except ImportError:
                 print("`cv2` module not available, can not show inference.")
+
+
+@click.command()
+@click.argument(
+    "data",
+    type=click.Path(exists=True),
+    required=True,
+)
+@click.option("--url", type=str, required=True, help="url given by isquare.")
+@click.option(
+    "--access-key", type=str, required=True, help="Access key provided by isquare."
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of concurrent requests.",
+)
+@click.option(
+    "-r",
+    "--rate",
+    type=float,
+    help="Target requests per second. If none, each request is sent as soon as "
+    + "the previous one is answered (closed loop).",
+)
+@click.option(
+    "-d",
+    "--duration",
+    type=float,
+    default=10.0,
+    show_default=True,
+    help="Duration of the measure, in seconds.",
+)
+@click.option(
+    "-w",
+    "--warmup",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Duration before the measure, not recorded, in seconds.",
+)
+@click.option(
+    "-t",
+    "--timeout",
+    type=float,
+    help="Deadline of each request, in seconds. Requests missing it count as errors.",
+)
+@click.option(
+    "--transport",
+    type=click.Choice(
+        ["default", "throughput", "low-latency", "constrained-bandwidth", "auto"]
+    ),
+    default="default",
+    show_default=True,
+    help="Websocket tuning profile, auto compares them on the data.",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the results as json.")
+@click.option(
+    "--debug",
+    is_flag=True,
+    help="Increase logging verbosity level to debug",
+)
+def bench(
+    data,
+    url,
+    access_key,
+    concurrency,
+    rate,
+    duration,
+    warmup,
+    timeout,
+    transport,
+    as_json,
+    debug,
+):  # pragma: no cover
+    """Load test a model with the same data."""
+
+    import asyncio
+    import json
+
+    from i2_client.bench import run_bench
+    from i2_client.client import I2Client
+
+    content = open_file(data)
+
+    async def _bench():
+        async with I2Client(
+            url,
+            access_key,
+            debug,
+            max_in_flight=concurrency,
+            transport=transport,
+            probe_input=content,
+            timeout=timeout,
+        ) as client:
+            return await run_bench(client, content, concurrency, rate, duration, warmup)
+
+    result = asyncio.run(_bench())
+
+    if as_json:
+        print(json.dumps(result.summary(), indent=2))
+    else:
+        print(result.report())
+
+
+@click.command()
+@click.argument(
+    "source",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+@click.option("--url", type=str, required=True, help="url given by isquare.")
+@click.option(
+    "--access-key", type=str, required=True, help="Access key provided by isquare."
+)
+@click.option(
+    "--save-path",
+    type=click.Path(dir_okay=False),
+    help="Path of the processed video. Default: <source>_processed.mp4",
+)
+@click.option(
+    "--max-in-flight",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of frames sent while waiting for their output.",
+)
+@click.option(
+    "--fourcc",
+    type=str,
+    default="mp4v",
+    show_default=True,
+    help="Codec of the processed video.",
+)
+@click.option(
+    "--debug",
+    is_flag=True,
+    help="Increase logging verbosity level to debug",
+)
+def video(
+    source, url, access_key, save_path, max_in_flight, fourcc, debug
+):  # pragma: no cover
+    """Run a model on every frame of a video."""
+
+    from pathlib import Path
+
+    from rich.progress import Progress
+
+    from i2_client.video import process_video
+
+    path = Path(source)
+    if save_path is None:
+        save_path = path.parent / f"{path.stem}_processed.mp4"
+    if Path(save_path).exists():
+        raise click.BadParameter(f"{save_path} already exists", param_hint="save-path")
+
+    with Progress() as progress:
+        task = progress.add_task(f"Processing {path.name}", total=None)
+
+        def _on_frame(count, info):
+            progress.update(task, completed=count, total=info.frames or None)
+
+        info = process_video(
+            path,
+            save_path,
+            url,
+            access_key,
+            max_in_flight=max_in_flight,
+            fourcc=fourcc,
+            on_frame=_on_frame,
+            debug=debug,
+        )
+
+    print(f"{info.frames} frames processed, saved at {save_path}")
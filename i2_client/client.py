@@ -8,37 +8,367 @@ permission, please contact the copyright holders and delete this file.
 """
 
 import asyncio
+import itertools
 import logging
-from typing import Any, Callable, List, Optional, Tuple
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import archipel_utils as utils
 import msgpack
-import websockets
-from rich.logging import RichHandler
+import numpy as np
+from websockets.exceptions import ConnectionClosed, WebSocketException
+
+from . import codecs as array_codecs
+from . import transport as ws_transport
+from .buffers import BufferPool
+from .cache import DiskCache, ResultCache, input_key
+from .realtime import RealtimeStream
+from .scheduler import SendGate, TokenBucket, priority_level
+from .stats import ClientStats, RequestTiming
+from .transport import transport_options
 
 log = logging.getLogger(__name__)
 
+MAX_RECONNECT_DELAY = 30.0
+PROBES = 3  # probe messages per transport profile, in auto mode
+
+
+def _identity(x: Any) -> Any:
+    """Default transform, picklable for process pools."""
+    return x
+
+
+def _encode(inp: Any, encode: Callable) -> Any:
+    """Encode an input, or keep it as is if it can not be encoded."""
+
+    try:
+        return encode(inp)
+    except Exception as error:
+        # send the input as is, packing or the worker will reject it if needed
+        log.debug(f"Fail to encode input, send it as is: {error}")
+        return inp
+
+
+def _encode_keys(
+    inputs: List[Any], encode: Callable, url: str, scope: str, picklable: bool = False
+) -> Tuple[List[Any], List[str]]:
+    """Encode inputs and compute their result cache keys.
+
+    With `picklable`, the buffers of the encoded inputs (like the `raw` codec
+    memoryviews) are copied to bytes, so they can be sent between processes.
+
+    Returns:
+        The encoded inputs, and their keys.
+    """
+
+    encoded, keys = [], []
+    for inp in inputs:
+        inp = _encode(inp, encode)
+        keys.append(input_key(url, inp, scope))
+        if picklable and isinstance(inp, dict):
+            inp = {
+                k: bytes(v) if isinstance(v, memoryview) else v for k, v in inp.items()
+            }
+        encoded.append(inp)
+
+    return encoded, keys
+
+
+def _pack(
+    inputs: List[Any], encode: Callable, request_id: Optional[int] = None
+) -> Tuple[bytes, float, float]:
+    """Encode and msgpack inputs into an inference message.
+
+    A single input is sent in an `Inference` message, several inputs are packed
+    together in a `BatchInference` message. Module level, so it can run in a
+    process pool.
+
+    Returns:
+        The message, and the encode and pack durations.
+    """
+
+    start = time.perf_counter()
+    data = [_encode(inp, encode) for inp in inputs]
+
+    msg: Dict[str, Any]
+    if len(data) == 1:
+        msg = {"action": "Inference", "data": data[0]}
+    else:
+        msg = {"action": "BatchInference", "data": data}
+
+    if request_id is not None:
+        msg["id"] = request_id
+
+    encoded = time.perf_counter()
+    try:
+        packed = msgpack.packb(msg)
+    except Exception as error:
+        raise ValueError(f"Fail to msgpack input: {error}")
+
+    return packed, encoded - start, time.perf_counter() - encoded
+
+
+def _unpackb(msg: bytes) -> Any:
+    """Unpack a msgpack message from the worker."""
+    return msgpack.unpackb(msg, strict_map_key=False)
+
+
+def _split(decoded_msg: Any, size: int) -> List[Any]:
+    """Split the response to a message of `size` inputs in per-input responses."""
+
+    if size == 1:
+        return [decoded_msg]
+
+    success, data = _get_output(decoded_msg, _identity)
+    if not success:
+        return [decoded_msg] * size
+
+    if not isinstance(data, list) or len(data) != size:
+        raise ValueError(f"Invalid batch response, expected {size} outputs")
+
+    return data
+
+
+def _unpack(
+    responses: List[Any], decode: Callable, outs: Optional[List[Any]] = None
+) -> List[Tuple[bool, Any]]:
+    """Validate and decode per-input responses, into their output buffer if any."""
+
+    outs = [None] * len(responses) if outs is None else outs
+    outputs = []
+    for response, out in zip(responses, outs):
+        decode_out: Callable = decode
+        if out is not None:
+            decode_out = partial(decode, out=out)
+        outputs.append(_get_output(response, decode_out))
+    return outputs
+
+
+def _missed(timeout: float) -> Dict[str, Any]:
+    """Failed response of an input which missed its deadline."""
+    return {"status": "Failure", "message": f"Deadline of {timeout:g}s exceeded"}
+
+
+def _succeeded(response: Any) -> bool:
+    """Whether a per-input response is a success, so it can be cached."""
+
+    return (
+        isinstance(response, dict)
+        and str(response.get("status", "")).lower() == "success"
+        and "data" in response
+    )
+
+
+def _get_output(decoded_msg: Any, decode: Callable) -> Tuple[bool, Any]:
+    """Validate a response and decode its output."""
+
+    if not isinstance(decoded_msg, dict):
+        raise ValueError("Invalid message received, not a map")
+
+    keys = set(decoded_msg.keys())
+    valid = keys.issubset(["status", "message", "data"])
+    backcomp_valid = keys.issubset(["status", "action", "message", "data"])
+    if not valid and not backcomp_valid:
+        raise ValueError("Invalid message received, missing fields")
+    log.debug("Got an valid response")
+
+    if decoded_msg["status"].lower() != "success":
+        return False, decoded_msg["message"]
+
+    try:
+        return True, decode(decoded_msg["data"])
+    except Exception as error:
+        return False, f"Fail to decode output: {error}"
+
+
+class _Request:
+    """A message sent to the worker, waiting for its response."""
+
+    def __init__(self, size: int, future: asyncio.Future, slots: List[Any]):
+        self.msg = b""  # kept to send it again after a reconnection
+        self.future = future
+        self.timing = RequestTiming(size)
+        self.sent_at = 0.0
+        self._slots = slots
+
+    def release(self):
+        """Release the in-flight slots taken by the request, only once."""
+        slots, self._slots = self._slots, []
+        for slot in slots:
+            slot.release()
+
 
 class I2Client:
     """A class to manage the connection to a worker and inferences."""
 
-    def __init__(self, url: str, access_key: str, debug: bool = False):
+    def __init__(
+        self,
+        url: str,
+        access_key: str,
+        debug: bool = False,
+        max_in_flight: int = 1,
+        batch_size: int = 1,
+        codecs: Sequence[str] = ("raw",),
+        image_quality: int = 90,
+        reconnect: bool = False,
+        reconnect_attempts: int = 10,
+        reconnect_delay: float = 0.5,
+        on_request: Optional[Callable[[RequestTiming], None]] = None,
+        executor: Union[None, str, Executor] = "thread",
+        cache: Union[None, ResultCache, DiskCache] = None,
+        transport: Union[str, Dict[str, Any]] = "default",
+        probe_input: Any = None,
+        rate_limit: Union[None, float, TokenBucket] = None,
+        timeout: Optional[float] = None,
+    ):
         """Initialize the isquare client.
 
         Args:
             url: Url of the model to use (provided on isquare.ai).
             access_key: Access key for the model (generated on isquare.ai)
             debug: Optional; Show extensive logs.
+            max_in_flight: Optional; Maximum number of messages sent to the worker
+                while their responses are still pending, for the whole client.
+                With the default (1), each message waits for the previous
+                response before being sent.
+            batch_size: Optional; Maximum number of inputs packed in one message.
+                Only used if the worker advertises batch support at registration,
+                capped to the batch size it advertises.
+            codecs: Optional; Array codecs to use for ndarray inputs, by order of
+                preference: "raw", or the image compressions "jpeg", "webp" and
+                "png" (uint8 images only). Only the codecs advertised by the
+                worker are used, otherwise arrays are sent with the default
+                archipel serialization.
+            image_quality: Optional; Quality of the lossy image codecs (1 to 100).
+            reconnect: Optional; Reconnect automatically when the connection is
+                lost, and send again the requests left without response.
+            reconnect_attempts: Optional; Number of reconnection attempts before
+                failing the pending requests.
+            reconnect_delay: Optional; Base delay of the exponential backoff
+                between reconnection attempts, in seconds (with random jitter,
+                capped to `MAX_RECONNECT_DELAY`).
+            on_request: Optional; Function called with the `RequestTiming` of each
+                completed request (durations of each phase and payload sizes).
+            executor: Optional; Where inputs are encoded and packed, and outputs
+                unpacked and decoded, so large payloads do not block the event
+                loop: "thread" (thread pool, the default), "process" (process
+                pool, for pure-Python codecs; encode/decode functions must be
+                picklable), any `Executor`, or None (on the event loop, for
+                small payloads).
+            cache: Optional; Cache of the outputs, by model, access key and
+                encoded input: `ResultCache` (in memory) or `DiskCache` (shared
+                by processes). Inputs found in it are not sent to the worker. It
+                can be shared between clients; cached outputs must not be
+                modified in place.
+            transport: Optional; Websocket tuning: a profile ("default",
+                "throughput" for large payloads, "low-latency" for small ones,
+                "constrained-bandwidth" for slow links), a dict of options
+                (compression, max_queue, read_limit, write_limit, ping_interval,
+                ping_timeout, close_timeout, nodelay), or "auto" to compare the
+                profiles with a few inferences of `probe_input` on the first
+                connection and keep the fastest.
+            probe_input: Optional; Input sent for inference by the "auto"
+                transport to compare the profiles, required by it (a
+                representative input gives a representative choice).
+            rate_limit: Optional; Maximum number of messages sent per second, to
+                stay within a quota: a rate (with bursts of one second of
+                messages), or a `TokenBucket`, which can be shared by clients
+                to limit their total rate. Messages waiting for the rate limit
+                or the in-flight window are sent by priority.
+            timeout: Optional; Default deadline of the inferences, in seconds
+                from the call (from the input for `stream`). Inputs without
+                output in time fail, and their late outputs are discarded.
 
         Returns:
             None.
 
         Raises:
-            None.
+            ValueError: Invalid in-flight window, batch size, executor,
+                transport (or "auto" without probe input), rate limit or
+                timeout.
         """
 
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        if isinstance(executor, str) and executor not in ["thread", "process"]:
+            raise ValueError(f"Invalid executor, must be thread or process: {executor}")
+        if timeout is not None and timeout <= 0:
+            raise ValueError(f"timeout must be positive, got {timeout}")
+        if transport == "auto" and probe_input is None:
+            # pings are not compressed nor buffered like messages, they can not
+            # tell the profiles apart
+            raise ValueError("The auto transport needs a probe_input to compare")
+
         self.url = url
         self.access_key = access_key
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.codecs = list(codecs)
+        self.image_quality = image_quality
+        self.reconnect = reconnect
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+
+        # number of reconnections and total time spent reconnecting, in seconds
+        self.reconnects = 0
+        self.downtime = 0.0
+
+        # per-phase durations and payload sizes of the requests
+        self.stats = ClientStats()
+        self.on_request = on_request
+
+        self.executor = executor
+        self._executor: Optional[Executor] = None
+
+        self.cache = cache
+
+        if rate_limit is not None and not isinstance(rate_limit, TokenBucket):
+            rate_limit = TokenBucket(rate_limit)
+        self.rate_limit = rate_limit
+        # in-flight slots, granted by priority within the rate limit
+        self.gate = SendGate(max_in_flight, rate_limit)
+
+        self.transport = transport
+        self.probe_input = probe_input
+        # resolved profile, and median probe duration of each profile in auto mode
+        self.profile = transport if isinstance(transport, str) else "custom"
+        self.probe_results: Dict[str, float] = {}
+        if transport != "auto":
+            self._transport_options = transport_options(transport)
+
+        # features advertised by the worker at registration
+        self.features: Dict[str, Any] = {}
+        self._batch_size = 1
+        self._use_ids = False
+
+        # requests waiting for their response, by id, in sending order
+        self._pending: "OrderedDict[int, _Request]" = OrderedDict()
+        self._next_id = 0
+
+        # background event loop of the synchronous session, see `open`
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+        from rich.logging import RichHandler
 
         handlers = [
             RichHandler(
@@ -58,8 +388,8 @@ class I2Client:
         logging.getLogger("websockets").propagate = False
 
         self.transforms = {
-            "encode": {"ndarray": utils.serialize_array},
-            "decode": {"ndarray": utils.deserialize_array},
+            "encode": {"ndarray": array_codecs.serialize_array},
+            "decode": {"ndarray": array_codecs.decode_array},
         }
 
     async def __aenter__(self):
@@ -76,8 +406,65 @@ class I2Client:
                 the specified url/access key pair.
         """
 
-        self._conn = websockets.connect(self.url, max_size=2**50)
-        self.websocket = await self._conn.__aenter__()
+        if self.transport == "auto" and not self.probe_results:
+            # probed once, the next connections (like the sessionless
+            # inferences) keep the selected profile
+            await self._select_transport()
+        await self._connect()
+
+        if self.executor == "thread":
+            self._executor = ThreadPoolExecutor(thread_name_prefix="i2-client")
+        elif self.executor == "process":
+            self._executor = ProcessPoolExecutor()
+        else:
+            self._executor = self.executor  # type: ignore
+
+        self.gate = SendGate(self.max_in_flight, self.rate_limit)
+        self._send_lock = asyncio.Lock()
+        self._connected = asyncio.Event()
+        self._connected.set()
+        self._reader = asyncio.ensure_future(self._read_responses())
+
+        return self
+
+    async def _connect(self, options: Optional[Dict[str, Any]] = None):
+        """Open the websocket and register to archipel."""
+
+        options = self._transport_options if options is None else options
+        conn = ws_transport.connect(self.url, options)
+        self.websocket = await conn.__aenter__()
+        self._conn = conn
+        ws_transport.apply(self.websocket, options)
+
+        try:
+            await self._register()
+        except BaseException:
+            await self._conn.__aexit__(None, None, None)
+            raise
+
+    async def _select_transport(self):
+        """Compare the transport profiles with probe messages, keep the fastest."""
+
+        for profile in ws_transport.AUTO_PROFILES:
+            await self._connect(transport_options(profile))
+            try:
+                durations = []
+                for _ in range(PROBES):
+                    start = time.perf_counter()
+                    msg, _, _ = _pack([self.probe_input], self.encode)
+                    await self.websocket.send(msg)
+                    await self.websocket.recv()
+                    durations.append(time.perf_counter() - start)
+            finally:
+                await self._conn.__aexit__(None, None, None)
+            self.probe_results[profile] = sorted(durations)[len(durations) // 2]
+
+        self.profile = min(self.probe_results, key=self.probe_results.__getitem__)
+        self._transport_options = transport_options(self.profile)
+        log.info(f"Transport profile {self.profile} selected: {self.probe_results}")
+
+    async def _register(self):
+        """Register to archipel on the opened websocket and setup the transforms."""
 
         msg = {"action": "Registration", "data": self.access_key}
 
@@ -107,16 +494,29 @@ class I2Client:
         else:
             raise ValueError("Missing types in archipel response")
 
-        self.encode = self.transforms["encode"].get(input_type, lambda x: x)
-        self.decode = self.transforms["decode"].get(output_type, lambda x: x)
+        # optional features, older workers do not advertise any
+        self.features = decoded_msg.get("features", {})
+        self._batch_size = min(self.batch_size, int(self.features.get("batch", 1)))
+        self._use_ids = bool(self.features.get("request_id", False))
+
+        codecs = [c for c in self.codecs if c in self.features.get("codecs", [])]
+        if codecs:
+            encode_array = partial(
+                array_codecs.encode_array, codecs=codecs, quality=self.image_quality
+            )
+            self.transforms["encode"]["ndarray"] = encode_array
+        else:
+            self.transforms["encode"]["ndarray"] = array_codecs.serialize_array
+
+        self.encode = self.transforms["encode"].get(input_type, _identity)
+        self.decode = self.transforms["decode"].get(output_type, _identity)
 
         log.info(
             "Successfully connected to archipel! "
-            + f"input_type={input_type}, output_type={output_type})"
+            + f"input_type={input_type}, output_type={output_type}, "
+            + f"batch_size={self._batch_size}, codecs={codecs}"
         )
 
-        return self
-
     async def __aexit__(self, *args, **kwargs):
         """Async context manager exit.
 
@@ -129,20 +529,410 @@ class I2Client:
         Raises:
             None.
         """
+
+        self._reader.cancel()
+        await asyncio.gather(self._reader, return_exceptions=True)
+        self._fail_pending(ConnectionError("Connection to archipel closed"))
+
+        if isinstance(self.executor, str) and self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = None
+
         await self._conn.__aexit__(*args, **kwargs)
 
+    async def _run(self, func: Callable, *args) -> Any:
+        """Run a function in the executor of the client, if any."""
+
+        if self._executor is None:
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _read_responses(self):
+        """Read the responses of the worker and dispatch them to their requests."""
+
+        try:
+            while True:
+                try:
+                    async for msg in self.websocket:
+                        await self._dispatch(msg)
+                except ConnectionClosed:
+                    pass
+
+                if not self.reconnect or not await self._reconnect():
+                    break
+        finally:
+            # unblock requests waiting for the connection, they will fail to send
+            self._connected.set()
+            self._fail_pending(ConnectionError("Connection to archipel lost"))
+
+    async def _reconnect(self) -> bool:
+        """Reconnect to archipel and send again the pending requests.
+
+        Attempts are spaced by an exponential backoff with full jitter.
+
+        Returns:
+            Whether the client is reconnected.
+        """
+
+        self._connected.clear()
+        lost = time.monotonic()
+        await self._conn.__aexit__(None, None, None)
+
+        for attempt in range(self.reconnect_attempts):
+            delay = min(MAX_RECONNECT_DELAY, self.reconnect_delay * 2**attempt)
+            await asyncio.sleep(random.uniform(0, delay))  # nosec
+            log.warning(
+                "Connection to archipel lost, reconnecting "
+                + f"(attempt {attempt + 1}/{self.reconnect_attempts})"
+            )
+
+            try:
+                await self._connect()
+            except (OSError, ValueError, WebSocketException) as error:
+                log.debug(f"Reconnection failed: {error}")
+                continue
+
+            try:
+                async with self._send_lock:
+                    for request in self._pending.values():
+                        await self.websocket.send(request.msg)
+                        request.sent_at = time.perf_counter()
+            except ConnectionClosed as error:
+                log.debug(f"Connection lost again: {error}")
+                continue
+
+            self.reconnects += 1
+            self.downtime += time.monotonic() - lost
+            self._connected.set()
+            log.warning(f"Reconnected, {len(self._pending)} request(s) sent again")
+            return True
+
+        self.downtime += time.monotonic() - lost
+        return False
+
+    async def _dispatch(self, msg: bytes):
+        """Resolve the request a response belongs to.
+
+        If the worker supports request ids, the response is matched with its id.
+        Otherwise, the worker answers in order, so it belongs to the oldest
+        pending request. Responses to cancelled requests are discarded.
+        """
+
+        received_at = time.perf_counter()
+        try:
+            if isinstance(self._executor, ThreadPoolExecutor):
+                # not worth shipping the message to another process
+                decoded_msg = await self._run(_unpackb, msg)
+            else:
+                decoded_msg = _unpackb(msg)
+            invalid = None
+        except Exception as error:
+            decoded_msg, invalid = None, ValueError(
+                f"Invalid message received: {error}"
+            )
+
+        request_id = None
+        if self._use_ids and isinstance(decoded_msg, dict):
+            request_id = decoded_msg.pop("id", None)
+
+        if request_id is not None:
+            request = self._pending.pop(request_id, None)
+        elif self._pending:
+            request = self._pending.pop(next(iter(self._pending)))
+        else:
+            request = None
+
+        if request is None:
+            log.debug("Got a response without pending request, discarded")
+            return
+
+        request.release()
+        request.timing.wait = received_at - request.sent_at
+        request.timing.unpack = time.perf_counter() - received_at
+        request.timing.bytes_received = len(msg)
+
+        if request.future.done():
+            self.stats.late_responses += 1
+            log.debug("Got a response to a cancelled request, discarded")
+        elif invalid is not None:
+            request.future.set_exception(invalid)
+        else:
+            request.future.set_result(decoded_msg)
+
+    def _fail_pending(self, error: Exception):
+        """Fail all the pending requests with the given error."""
+
+        pending, self._pending = self._pending, OrderedDict()
+        for request in pending.values():
+            request.release()
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    async def _submit(
+        self,
+        inputs: List[Any],
+        encode: Callable,
+        decode: Callable,
+        window: Optional[asyncio.Semaphore] = None,
+        outs: Optional[List[Any]] = None,
+        priority: str = "normal",
+        deadline: Optional[Tuple[float, float]] = None,
+    ) -> List[Tuple[bool, Any]]:
+        """Get the outputs of inputs, sent in one message if not in the cache.
+
+        Outputs are decoded into the given output buffers (or buffer pools), if
+        any. With a deadline (loop time and timeout), the request is cancelled
+        if not answered in time: its inputs fail, and its response is discarded
+        when it arrives.
+        """
+
+        keys: List[str] = []  # result cache keys, if any
+        encode_time = 0.0
+        if self.cache is not None:
+            cache = self.cache
+            encode_start = time.perf_counter()
+            inputs, keys = await self._run(
+                _encode_keys,
+                inputs,
+                encode,
+                self.url,
+                self.access_key,
+                isinstance(self._executor, ProcessPoolExecutor),
+            )
+            encode_time = time.perf_counter() - encode_start
+            encode = _identity
+            responses = await self._cache_io(lambda: [cache.get(k) for k in keys])
+        else:
+            responses = [None] * len(inputs)
+
+        misses = [index for index, response in enumerate(responses) if response is None]
+        timing = None
+        if misses:
+            request = self._request(
+                [inputs[index] for index in misses], encode, window, priority
+            )
+            if deadline is None:
+                fresh, timing = await request
+            else:
+                at, timeout = deadline
+                remaining = at - asyncio.get_running_loop().time()
+                try:
+                    fresh, timing = await asyncio.wait_for(request, max(0, remaining))
+                except asyncio.TimeoutError:
+                    self.stats.deadline_misses += 1
+                    log.debug(f"Deadline of {timeout:g}s exceeded, request cancelled")
+                    fresh = [_missed(timeout)] * len(misses)
+            for index, response in zip(misses, fresh):
+                responses[index] = response
+
+            if keys:
+                await self._cache_io(
+                    lambda: [
+                        cache.put(keys[index], responses[index])
+                        for index in misses
+                        if _succeeded(responses[index])
+                    ]
+                )
+
+        decode_start = time.perf_counter()
+        process = isinstance(self._executor, ProcessPoolExecutor)
+        if outs is not None and process:
+            # buffers can not be written from another process
+            outputs = _unpack(responses, decode, outs)
+        elif process and isinstance(self.cache, DiskCache) and keys:
+            # disk cache hits are memoryviews over a memory map, which can not be
+            # sent to another process: decode them here, the fresh responses there
+            hits = [index for index in range(len(responses)) if index not in misses]
+            decoded = dict(zip(hits, _unpack([responses[i] for i in hits], decode)))
+            if misses:
+                fresh_outputs = await self._run(
+                    _unpack, [responses[index] for index in misses], decode
+                )
+                decoded.update(zip(misses, fresh_outputs))
+            outputs = [decoded[index] for index in range(len(responses))]
+        else:
+            outputs = await self._run(_unpack, responses, decode, outs)
+
+        if timing is not None:
+            for (_, output), out in zip(outputs, outs or [None] * len(outputs)):
+                if out is None and isinstance(output, np.ndarray):
+                    timing.unbuffered_outputs += 1
+                    timing.unbuffered_bytes += output.nbytes
+
+            timing.encode += encode_time
+            timing.decode = time.perf_counter() - decode_start
+            timing.total += encode_time + timing.decode
+            self.stats.record(timing)
+            if self.on_request is not None:
+                self.on_request(timing)
+
+        return outputs
+
+    async def _cache_io(self, func: Callable[[], Any]) -> Any:
+        """Access the cache, in a thread if it is on disk."""
+
+        if not isinstance(self.cache, DiskCache):
+            return func()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func)
+
+    async def _request(
+        self,
+        inputs: List[Any],
+        encode: Callable,
+        window: Optional[asyncio.Semaphore] = None,
+        priority: str = "normal",
+    ) -> Tuple[List[Any], RequestTiming]:
+        """Send inputs in one message and wait for their responses.
+
+        The in-flight slots (of the optional `window` of the call, then of the
+        client, by priority and within its rate limit) are taken until the
+        response is received, even if the caller is cancelled before.
+
+        Returns:
+            The per-input responses, not decoded yet, and the timing of the
+            request (without the decoding).
+        """
+
+        queued_at = time.perf_counter()
+        slots: List[Any] = []
+        try:
+            if window is not None:
+                await window.acquire()
+                slots.append(window)
+            await self.gate.acquire(priority)
+            slots.append(self.gate)
+        except BaseException:
+            for slot in slots:
+                slot.release()
+            raise
+
+        start = time.perf_counter()
+        request = _Request(
+            len(inputs), asyncio.get_running_loop().create_future(), slots
+        )
+        timing = request.timing
+        timing.queue = start - queued_at
+
+        request_id = self._next_id
+        self._next_id += 1
+        try:
+            msg, timing.encode, timing.pack = await self._run(
+                _pack, inputs, encode, request_id if self._use_ids else None
+            )
+            timing.bytes_sent = len(msg)
+            request.msg = msg
+
+            # wait for the end of a reconnection, if any
+            await self._connected.wait()
+
+            # register and send atomically, so pending order is the sending order
+            async with self._send_lock:
+                self._pending[request_id] = request
+                try:
+                    send_start = time.perf_counter()
+                    await self.websocket.send(msg)
+                    request.sent_at = time.perf_counter()
+                    timing.send = request.sent_at - send_start
+                except ConnectionClosed as error:
+                    if not self.reconnect or self._reader.done():
+                        self._pending.pop(request_id, None)
+                        raise ConnectionError("Connection to archipel lost") from error
+                    # still pending, it is sent again once reconnected
+                except asyncio.CancelledError:
+                    # the message is written before the send yields: keep it
+                    # pending, so its response is matched (and discarded)
+                    request.future.cancel()
+                    raise
+                except BaseException:
+                    self._pending.pop(request_id, None)
+                    raise
+            log.debug(f"Data sended, {len(self._pending)} response(s) pending")
+
+        except BaseException:
+            if self._pending.get(request_id) is not request:
+                request.release()
+            raise
+
+        decoded_msg = await request.future
+        responses = _split(decoded_msg, len(inputs))
+        timing.total = time.perf_counter() - start
+
+        return responses, timing
+
+    def _outs(self, out: Any, size: int) -> Optional[List[Any]]:
+        """Output buffer (or buffer pool) of each of `size` inputs, if any."""
+
+        if out is None:
+            return None
+        if isinstance(out, BufferPool):
+            return [out] * size
+        if isinstance(out, np.ndarray):
+            out = [out]
+        if len(out) != size:
+            raise ValueError(f"Expected {size} output buffers, got {len(out)}")
+        return list(out)
+
+    def _batches(self, inputs: List[Any]) -> List[List[Any]]:
+        """Split inputs in messages of the negotiated batch size."""
+        size = self._batch_size
+        return [inputs[index : index + size] for index in range(0, len(inputs), size)]
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[Tuple[float, float]]:
+        """Deadline (loop time and timeout) of a call, if any."""
+
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is None:
+            return None
+        if timeout <= 0:
+            raise ValueError(f"timeout must be positive, got {timeout}")
+        return asyncio.get_running_loop().time() + timeout, timeout
+
+    def _window(self, max_in_flight: Optional[int]) -> Optional[asyncio.Semaphore]:
+        """In-flight window of a call, if it overrides the client one."""
+
+        if max_in_flight is None:
+            return None
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+        return asyncio.Semaphore(max_in_flight)
+
     async def async_inference(
         self,
         inputs: Any,
         encode: Optional[Callable] = None,
         decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        out: Any = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
     ) -> List[Tuple[bool, Any]]:
         """Send inference to archipel in async way.
 
+        Inputs are sent without waiting for the previous responses as long as
+        less than `max_in_flight` responses are pending, and outputs are
+        returned in the input order. If the worker supports it, up to
+        `batch_size` inputs are sent per message. Several coroutines can use
+        the same client concurrently.
+
         Args:
             inputs: The inputs to send to the worker.
             encode: Optional; Specify a specific input encoding.
             decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Limit the in-flight window of this call (the
+                client window still applies).
+            out: Optional; Where ndarray outputs are decoded into, instead of new
+                arrays: an array (single input), one array per input, or a
+                `BufferPool` (hand the arrays back with `release`). The decode
+                function must accept an `out` keyword, like the default one.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk"): messages waiting to be sent are sent by priority.
+            timeout: Optional; Deadline of the call, in seconds (overrides the
+                client one). Inputs without output in time fail, and their late
+                outputs are discarded.
 
         Returns:
             List of Tuple composed of two values: bool to indicate whether inference
@@ -150,9 +940,10 @@ class I2Client:
 
         Raises:
             ValueError: There was an error encoding or packing the given
-                input (the specific error is printed).
-            RuntimeError: Ther was an error during the inference (the
-                specific error message is printed).
+                input (the specific error is printed), invalid output buffers,
+                priority or timeout.
+            ConnectionError: The connection was lost before all outputs were
+                received.
         """
 
         if not isinstance(inputs, list):
@@ -160,55 +951,357 @@ class I2Client:
 
         encode = self.encode if encode is None else encode
         decode = self.decode if decode is None else decode
+        window = self._window(max_in_flight)
+        outs = self._outs(out, len(inputs))
+        priority_level(priority)
+        deadline = self._deadline(timeout)
+
+        tasks = [
+            asyncio.ensure_future(
+                self._submit(
+                    batch, encode, decode, window, batch_outs, priority, deadline
+                )
+            )
+            for batch, batch_outs in zip(
+                self._batches(inputs),
+                self._batches(outs) if outs else itertools.repeat(None),
+            )
+        ]
+
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return [output for outputs in results for output in outputs]
+
+    async def as_completed(
+        self,
+        inputs: List[Any],
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        out: Any = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[Tuple[int, Tuple[bool, Any]], None]:
+        """Send inference to archipel and iterate over the outputs as they complete.
+
+        With workers supporting request ids, fast outputs are not held up behind
+        slow ones. Otherwise, outputs complete in the input order.
+
+        Args:
+            inputs: The inputs to send to the worker.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Limit the in-flight window of this call (the
+                client window still applies).
+            out: Optional; Where ndarray outputs are decoded into, instead of new
+                arrays: an array (single input), one array per input, or a
+                `BufferPool` (hand the arrays back with `release`). The decode
+                function must accept an `out` keyword, like the default one.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk"): messages waiting to be sent are sent by priority.
+            timeout: Optional; Deadline of the call, in seconds (overrides the
+                client one). Inputs without output in time fail, and their late
+                outputs are discarded.
+
+        Yields:
+            Tuple of the input index and the usual output tuple: bool to indicate
+            whether inference is a success and the inference is success or an
+            error message if fail.
+
+        Raises:
+            ValueError: There was an error encoding or packing an input.
+            ConnectionError: The connection was lost before all outputs were
+                received.
+        """
+
+        encoder: Callable = self.encode if encode is None else encode
+        decoder: Callable = self.decode if decode is None else decode
+        window = self._window(max_in_flight)
+        inputs = list(inputs)
+        outs = self._outs(out, len(inputs))
+        priority_level(priority)
+        deadline = self._deadline(timeout)
+
+        async def _indexed(start: int, batch: List[Any]):
+            batch_outs = outs[start : start + len(batch)] if outs else None
+            outputs = await self._submit(
+                batch, encoder, decoder, window, batch_outs, priority, deadline
+            )
+            return start, outputs
+
+        tasks = []
+        start = 0
+        for batch in self._batches(inputs):
+            tasks.append(asyncio.ensure_future(_indexed(start, batch)))
+            start += len(batch)
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                start, outputs = await next_done
+                for index, output in enumerate(outputs, start):
+                    yield index, output
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(
+        self,
+        source: Union[Iterable, AsyncIterable],
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        out: Optional[BufferPool] = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[Tuple[bool, Any], None]:
+        """Stream inputs to archipel and iterate over the outputs as they come.
+
+        At most `max_in_flight` messages are waiting for a response or to be
+        consumed, and at most as many inputs are read ahead from the source, so
+        a fast source does not grow memory: it is only consumed as fast as
+        outputs are.
+
+        Args:
+            source: Sync or async iterable of inputs. Sync iterables are read in
+                a thread, so a blocking source (like a camera) does not block the
+                event loop.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Override the client in-flight window.
+            out: Optional; `BufferPool` to decode ndarray outputs into, instead of
+                new arrays. Hand them back with `release` once used.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk"): messages waiting to be sent are sent by priority.
+            timeout: Optional; Deadline of each input, in seconds from its
+                sending (overrides the client one). Inputs without output in
+                time fail, and their late outputs are discarded.
 
-        outputs = []
-        for inp in inputs:
+        Yields:
+            Tuple composed of two values: bool to indicate whether inference is a
+            success and the inference is success or an error message if fail, in
+            the order of the source.
+
+        Raises:
+            ValueError: There was an error encoding or packing an input.
+            ConnectionError: The connection was lost before all outputs were
+                received.
+        """
+
+        encode = self.encode if encode is None else encode
+        decode = self.decode if decode is None else decode
+        window = self.max_in_flight if max_in_flight is None else max_in_flight
+        if window < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {window}")
+        priority_level(priority)
+        self._deadline(timeout)  # validate it
+
+        inputs: asyncio.Queue = asyncio.Queue(maxsize=window)
+        sent: asyncio.Queue = asyncio.Queue()  # requests, in the source order
+        slots = asyncio.Semaphore(window)
+        end = object()
+
+        async def _read():
             try:
-                inp = encode(inp)
-            except Exception as error:
-                ValueError(f"Fail to encode input: {error}")
+                if hasattr(source, "__aiter__"):
+                    async for inp in source:
+                        await inputs.put(inp)
+                else:
+                    loop = asyncio.get_running_loop()
+                    iterator = iter(source)
+                    while True:
+                        inp = await loop.run_in_executor(None, next, iterator, end)
+                        if inp is end:
+                            break
+                        await inputs.put(inp)
+            except Exception:
+                await inputs.put(end)  # stop the sender, the error is raised later
+                raise
+            await inputs.put(end)
 
+        async def _send():
             try:
-                msg = msgpack.packb({"action": "Inference", "data": inp})
-            except Exception as error:
-                raise ValueError(f"Fail to msgpack input: {error}")
+                done = False
+                while not done:
+                    batch = [await inputs.get()]
+                    while len(batch) < self._batch_size and not inputs.empty():
+                        batch.append(inputs.get_nowait())
+                    if batch[-1] is end:
+                        batch.pop()
+                        done = True
+                    if not batch:
+                        break
 
-            await self.websocket.send(msg)
-            log.debug("Data sended, wait for response")
+                    await slots.acquire()
+                    outs = None if out is None else [out] * len(batch)
+                    deadline = self._deadline(timeout)
+                    request = self._submit(
+                        batch, encode, decode, None, outs, priority, deadline
+                    )
+                    sent.put_nowait(asyncio.ensure_future(request))
+            finally:
+                sent.put_nowait(None)
 
-            msg = await self.websocket.recv()
-            decoded_msg = msgpack.unpackb(msg, strict_map_key=False)
+        reader = asyncio.ensure_future(_read())
+        sender = asyncio.ensure_future(_send())
 
-            keys = set(decoded_msg.keys())
-            valid = keys.issubset(["status", "message", "data"])
-            backcomp_valid = keys.issubset(["status", "action", "message", "data"])
-            if not valid and not backcomp_valid:
-                raise ValueError("Invalid message received, missing fields")
-            log.debug("Got an valid response")
+        try:
+            while True:
+                request = await sent.get()
+                if request is None:
+                    break
+                outputs = await request
+                slots.release()
+                for output in outputs:
+                    yield output
 
-            if decoded_msg["status"].lower() == "success":
-                try:
-                    inference = decode(decoded_msg["data"])
-                    outputs.append((True, inference))
-                except Exception as error:
-                    outputs.append((False, f"Fail to decode output: {error}"))
-            else:
-                outputs.append((False, decoded_msg["message"]))
+            await sender  # raise its error, if any
+            await reader
 
-        return outputs
+        finally:
+            tasks = [reader, sender]
+            while not sent.empty():
+                tasks.append(sent.get_nowait())
+            for task in tasks:
+                if task is not None:
+                    task.cancel()
+            await asyncio.gather(*[t for t in tasks if t], return_exceptions=True)
+
+    def realtime(
+        self,
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: int = 1,
+        priority: str = "realtime",
+        timeout: Optional[float] = None,
+    ) -> RealtimeStream:
+        """Latest-frame-wins stream for a live source, like a camera.
+
+        Frames are submitted with `submit` as they are captured and at most one
+        waits to be sent, a newer one replacing it, so a slow worker drops
+        frames instead of delaying them. See `RealtimeStream`.
+
+        Args:
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Number of frames sent while waiting for
+                their output.
+            priority: Optional; Priority of the frames.
+            timeout: Optional; Deadline of each frame, in seconds.
+
+        Returns:
+            The stream, to use as an async context manager.
+
+        Raises:
+            ValueError: Invalid in-flight window or priority.
+        """
+
+        priority_level(priority)
+        return RealtimeStream(self, encode, decode, max_in_flight, priority, timeout)
+
+    def __enter__(self):
+        """Context manager enter, opening a synchronous session."""
+        return self.open()
+
+    def __exit__(self, *args, **kwargs):
+        """Context manager exit, closing the synchronous session."""
+        self.close()
+
+    def open(self):
+        """Open a persistent connection for synchronous inferences.
+
+        The connection is owned by an event loop running in a background thread,
+        so successive calls to `inference` reuse it instead of connecting and
+        registering each time.
+
+        Args:
+            None.
+
+        Returns:
+            The client, connected to archipel with the given info.
+
+        Raises:
+            ConnectionError: There's a problem connecting to archipel with
+                the specified url/access key pair.
+        """
+
+        if self._loop is not None:
+            return self
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever, name="i2-client", daemon=True
+        )
+        thread.start()
+
+        try:
+            asyncio.run_coroutine_threadsafe(self.__aenter__(), loop).result()
+        except BaseException:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            raise
+
+        self._loop, self._thread = loop, thread
+        log.debug("Synchronous session opened")
+
+        return self
+
+    def close(self):
+        """Close the synchronous session opened with `open`, if any.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        if self._loop is None or self._thread is None:
+            return
+
+        loop, thread = self._loop, self._thread
+        self._loop, self._thread = None, None
+
+        try:
+            coroutine = self.__aexit__(None, None, None)
+            asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            log.debug("Synchronous session closed")
 
     def inference(
         self,
         inputs: Any,
         encode: Optional[Callable] = None,
         decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
     ) -> List[Tuple[bool, Any]]:
         """Send inference to archipel in sync way.
 
+        If a session is open (see `open`), its connection is used. Otherwise a
+        connection is opened and closed for this call only.
+
         Args:
             inputs: The inputs to send to the worker.
             encode: Optional; Specify a specific input encoding.
             decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Override the client in-flight window.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk").
+            timeout: Optional; Deadline of the call, in seconds (overrides the
+                client one).
 
         Returns:
             List of Tuple composed of two values: bool to indicate whether inference
@@ -218,9 +1311,28 @@ class I2Client:
             None.
         """
 
+        if self._loop is not None:
+            # persistent session, reuse its connection
+            coroutine = self.async_inference(
+                inputs,
+                encode,
+                decode,
+                max_in_flight,
+                priority=priority,
+                timeout=timeout,
+            )
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
         async def _inference(self, inputs):
             await self.__aenter__()
-            outputs = await self.async_inference(inputs, encode, decode)
+            outputs = await self.async_inference(
+                inputs,
+                encode,
+                decode,
+                max_in_flight,
+                priority=priority,
+                timeout=timeout,
+            )
             await self.__aexit__(exc_type=None, exc_value=None, traceback=None)
             return outputs
 
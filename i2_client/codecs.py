@@ -0,0 +1,233 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import importlib.util
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+# OpenCV (also loaded by archipel_utils) is slow to import, so it is only
+# imported when an image codec or the default serialization is first used
+OPENCV_AVAILABLE = importlib.util.find_spec("cv2") is not None
+
+# An encoder returns None when it can not handle the given array, so the next
+# codec by order of preference is tried.
+Encoder = Callable[..., Optional[dict]]
+Decoder = Callable[[dict], np.ndarray]
+
+
+def encode_raw(array: np.ndarray, **kwargs) -> Optional[dict]:
+    """Encode an array as its dtype, shape and raw buffer.
+
+    The buffer is not copied (unless the array is not C-contiguous): msgpack
+    writes it directly into the message.
+
+    Args:
+        array: The array to encode.
+
+    Returns:
+        The encoded array, or None if its dtype has no raw representation.
+
+    Raises:
+        None.
+    """
+
+    if array.dtype.hasobject:
+        return None
+
+    if not array.flags.c_contiguous:
+        array = array.copy(order="C")
+
+    return {
+        "codec": "raw",
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+        # memoryview can not cast arrays without elements
+        "data": array.data.cast("B") if array.size else b"",
+    }
+
+
+def decode_raw(payload: dict) -> np.ndarray:
+    """Decode an array encoded with `encode_raw`.
+
+    The array is a read-only view on the received buffer, without any copy.
+
+    Args:
+        payload: The encoded array.
+
+    Returns:
+        The decoded array.
+
+    Raises:
+        None.
+    """
+
+    array = np.frombuffer(payload["data"], dtype=np.dtype(payload["dtype"]))
+    return array.reshape(tuple(payload["shape"]))
+
+
+IMAGE_FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+def encode_image(
+    array: np.ndarray, codec: str, quality: int = 90, **kwargs
+) -> Optional[dict]:
+    """Compress an image array with OpenCV.
+
+    Args:
+        array: The array to encode.
+        codec: Image format, one of `IMAGE_FORMATS`.
+        quality: Optional; Quality of lossy formats (JPEG and WebP), from 1 to 100.
+            PNG is lossless and ignores it.
+
+    Returns:
+        The encoded image, or None if the array is not an uint8 image (2d, or 3d
+        with 1, 3 or 4 channels) or OpenCV is not available.
+
+    Raises:
+        ValueError: The array can not be compressed.
+    """
+
+    if not OPENCV_AVAILABLE or array.dtype != np.uint8:
+        return None
+    if array.ndim not in [2, 3] or (
+        array.ndim == 3 and array.shape[2] not in [1, 3, 4]
+    ):
+        return None
+    if codec == "jpeg" and array.ndim == 3 and array.shape[2] == 4:
+        return None  # no alpha channel in JPEG
+
+    import cv2
+
+    if codec == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif codec == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+
+    success, encoded = cv2.imencode(IMAGE_FORMATS[codec], array, params)
+    if not success:
+        raise ValueError(f"Fail to encode image as {codec}")
+
+    return {"codec": codec, "shape": list(array.shape), "data": encoded.tobytes()}
+
+
+def decode_image(payload: dict) -> np.ndarray:
+    """Decode an image encoded with `encode_image`.
+
+    Args:
+        payload: The encoded image.
+
+    Returns:
+        The decoded image, with the shape of the encoded one.
+
+    Raises:
+        ModuleNotFoundError: OpenCV is not available.
+        ValueError: The image can not be decoded.
+    """
+
+    if not OPENCV_AVAILABLE:
+        raise ModuleNotFoundError("opencv-python is not available")
+
+    import cv2
+
+    shape = tuple(payload["shape"])
+    gray = len(shape) != 3 or shape[2] == 1
+    flags = cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_UNCHANGED
+    array = cv2.imdecode(np.frombuffer(payload["data"], dtype=np.uint8), flags)
+    if array is None:
+        raise ValueError(f"Fail to decode image as {payload['codec']}")
+
+    return array.reshape(shape)
+
+
+def serialize_array(array: np.ndarray) -> Any:
+    """Default archipel serialization of an array, imported on first use."""
+
+    import archipel_utils
+
+    return archipel_utils.serialize_array(array)
+
+
+def deserialize_array(data: Any) -> np.ndarray:
+    """Default archipel deserialization of an array, imported on first use."""
+
+    import archipel_utils
+
+    return archipel_utils.deserialize_array(data)
+
+
+ENCODERS: Dict[str, Encoder] = {"raw": encode_raw}
+DECODERS: Dict[str, Decoder] = {"raw": decode_raw}
+for _codec in IMAGE_FORMATS:
+    ENCODERS[_codec] = partial(encode_image, codec=_codec)
+    DECODERS[_codec] = decode_image
+
+
+def encode_array(array: np.ndarray, codecs: Sequence[str] = (), **kwargs) -> Any:
+    """Encode an array with the first codec able to handle it.
+
+    Args:
+        array: The array to encode.
+        codecs: Optional; Codec names by order of preference. If none can encode
+            the array, the default archipel serialization is used.
+        kwargs: Optional; Options given to the codec encoders.
+
+    Returns:
+        The encoded array.
+
+    Raises:
+        KeyError: Unknown codec name.
+    """
+
+    for codec in codecs:
+        payload = ENCODERS[codec](array, **kwargs)
+        if payload is not None:
+            return payload
+
+    return serialize_array(array)
+
+
+def decode_array(data: Any, out: Any = None) -> np.ndarray:
+    """Decode an array encoded with any codec or the default archipel serialization.
+
+    Args:
+        data: The encoded array.
+        out: Optional; Array to write the decoded array into, of the same shape and
+            dtype, or a `BufferPool` to acquire it from.
+
+    Returns:
+        The decoded array, `out` if given.
+
+    Raises:
+        ValueError: Unknown codec, or `out` does not match the decoded array.
+    """
+
+    if isinstance(data, dict) and "codec" in data:
+        if data["codec"] not in DECODERS:
+            raise ValueError(f"Unknown array codec: {data['codec']}")
+        array = DECODERS[data["codec"]](data)
+    else:
+        array = deserialize_array(data)
+
+    if out is None:
+        return array
+
+    if hasattr(out, "acquire"):
+        out = out.acquire(array.shape, array.dtype)
+    if out.shape != array.shape or out.dtype != array.dtype:
+        raise ValueError(
+            f"Can not decode an array of shape {array.shape} and dtype {array.dtype}"
+            + f" into one of shape {out.shape} and dtype {out.dtype}"
+        )
+
+    np.copyto(out, array)
+    return out
@@ -0,0 +1,266 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .client import I2Client
+from .stats import percentile
+
+log = logging.getLogger(__name__)
+
+MIN_SAMPLES = 20  # latencies measured before the hedge delay follows them
+
+
+class HedgedClient:
+    """Clients of the same model deployed behind several urls, with hedging.
+
+    Each call is sent to the least loaded endpoint. If it has not returned
+    after the hedge delay (a percentile of the recent latencies), it is sent
+    again to another endpoint and the first output is used, the other request
+    is cancelled (its late response is discarded). A call failing with a
+    connection error is sent to another endpoint right away.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        access_key: str,
+        hedge_percentile: float = 95.0,
+        hedge_delay: float = 1.0,
+        min_hedge_delay: float = 0.005,
+        history: int = 1000,
+        **kwargs,
+    ):
+        """Initialize the hedged clients.
+
+        Args:
+            urls: Urls of the same model (provided on isquare.ai).
+            access_key: Access key for the model (generated on isquare.ai)
+            hedge_percentile: Optional; Percentile of the recent latencies after
+                which a call is hedged: with 95, about 5% of the calls are.
+            hedge_delay: Optional; Hedge delay until `MIN_SAMPLES` latencies are
+                measured, in seconds.
+            min_hedge_delay: Optional; Minimum hedge delay, in seconds.
+            history: Optional; Number of recent latencies kept.
+            kwargs: Optional; Other arguments given to each `I2Client`, like
+                `max_in_flight` or `batch_size`.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Less than two urls, or invalid percentile.
+        """
+
+        if len(urls) < 2:
+            raise ValueError(f"At least two urls are needed to hedge, got {len(urls)}")
+        if not 0 < hedge_percentile < 100:
+            raise ValueError(
+                f"hedge_percentile must be between 0 and 100, got {hedge_percentile}"
+            )
+
+        self.urls = list(urls)
+        self.access_key = access_key
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.clients = [I2Client(url, access_key, **kwargs) for url in self.urls]
+        self.loads = [0] * len(self.clients)
+
+        # latencies of the calls, to compute the hedge delay, in seconds
+        self.latencies: Deque[float] = deque(maxlen=history)
+
+        self.calls = 0
+        self.hedges = 0  # calls sent to a second endpoint
+        self.hedge_wins = 0  # hedged calls answered first by the second endpoint
+        self.failovers = 0  # calls sent again after a connection error
+
+    @property
+    def hedge_delay(self) -> float:
+        """Delay after which a call is sent to a second endpoint, in seconds."""
+
+        if len(self.latencies) < MIN_SAMPLES:
+            return self.initial_hedge_delay
+        delay = percentile(self.latencies, self.hedge_percentile)
+        return max(self.min_hedge_delay, delay)
+
+    @property
+    def hedge_rate(self) -> float:
+        """Fraction of the calls sent to a second endpoint."""
+        return self.hedges / self.calls if self.calls else 0.0
+
+    async def __aenter__(self):
+        """Async context manager enter, connecting all clients to archipel.
+
+        Args:
+            None.
+
+        Returns:
+            The hedged clients, all connected.
+
+        Raises:
+            ConnectionError: There's a problem connecting to archipel with
+                one of the specified urls and the access key.
+        """
+
+        results = await asyncio.gather(
+            *[client.__aenter__() for client in self.clients], return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await asyncio.gather(
+                *[
+                    client.__aexit__(None, None, None)
+                    for client, result in zip(self.clients, results)
+                    if not isinstance(result, BaseException)
+                ]
+            )
+            raise errors[0]
+
+        log.info(f"Connected to {len(self.clients)} endpoints")
+
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        """Async context manager exit, closing all connections.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        await asyncio.gather(
+            *[client.__aexit__(*args, **kwargs) for client in self.clients]
+        )
+
+    def _unload(self, conn: int, task: asyncio.Future):
+        """Count the end of a call to an endpoint."""
+        self.loads[conn] -= 1
+
+    def _least_loaded(self, excluded: List[int]) -> Optional[int]:
+        """Index of the endpoint with the fewest pending calls, if any.
+
+        The responses still expected by cancelled requests count too: their
+        endpoint is busy until they arrive.
+        """
+
+        candidates = [i for i in range(len(self.clients)) if i not in excluded]
+        if not candidates:
+            return None
+        return min(
+            candidates, key=lambda i: self.loads[i] + len(self.clients[i]._pending)
+        )
+
+    async def async_inference(
+        self,
+        inputs: Any,
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+    ) -> List[Tuple[bool, Any]]:
+        """Send inference to archipel in async way, hedged over the endpoints.
+
+        Args:
+            inputs: The inputs to send to the workers.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Override the in-flight window of each client.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk").
+            timeout: Optional; Deadline of the call, in seconds, including the
+                hedge delay (overrides the one of the clients).
+
+        Returns:
+            List of Tuple composed of two values: bool to indicate whether inference
+            is a success and the inference is success or an error message if fail.
+
+        Raises:
+            ValueError: There was an error encoding or packing the given
+                input (the specific error is printed).
+            ConnectionError: The connection to all endpoints was lost.
+        """
+
+        start = time.perf_counter()
+        tried: List[int] = []
+        tasks: Dict[asyncio.Future, int] = {}  # endpoint of each request
+
+        def _send() -> bool:
+            conn = self._least_loaded(tried)
+            if conn is None:
+                return False
+            tried.append(conn)
+            self.loads[conn] += 1
+            remaining = None
+            if timeout is not None:
+                remaining = max(1e-3, timeout - (time.perf_counter() - start))
+            task = asyncio.ensure_future(
+                self.clients[conn].async_inference(
+                    inputs,
+                    encode,
+                    decode,
+                    max_in_flight,
+                    priority=priority,
+                    timeout=remaining,
+                )
+            )
+            task.add_done_callback(partial(self._unload, conn))
+            tasks[task] = conn
+            return True
+
+        self.calls += 1
+        _send()
+        error: Optional[ConnectionError] = None
+        hedge_after: Optional[float] = self.hedge_delay
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # too slow, hedge it
+                    if _send():
+                        self.hedges += 1
+                        log.debug(f"Call hedged after {hedge_after:.3f}s")
+                    hedge_after = None
+                    continue
+
+                for task in done:
+                    conn = tasks.pop(task)
+                    exception = task.exception()
+                    if exception is None:
+                        if conn != tried[0]:
+                            self.hedge_wins += 1
+                        outputs = task.result()
+                        self.latencies.append(time.perf_counter() - start)
+                        return outputs
+
+                    if not isinstance(exception, ConnectionError):
+                        raise exception
+                    error = exception
+                    if _send():
+                        self.failovers += 1
+                        log.warning(f"Endpoint {self.urls[conn]} failed: {error}")
+
+            # every endpoint failed with a connection error
+            raise error or ConnectionError("No endpoint to send the call to")
+
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,340 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from .client import I2Client
+from .realtime import RealtimeStream
+
+log = logging.getLogger(__name__)
+
+
+class Pacer:
+    """Sleep until the next tick of a given rate, without busy waiting.
+
+    Ticks are on a fixed schedule, so the time spent between two waits does
+    not slow the rate down. A caller late by more than one period skips the
+    missed ticks instead of catching up with a burst.
+    """
+
+    def __init__(self, rate: float):
+        """Initialize the pacer.
+
+        Args:
+            rate: Ticks per second, can be changed at any time.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid rate.
+        """
+
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+
+        self.rate = rate
+        self._next: Optional[float] = None
+
+    def wait(self, stop: Optional[threading.Event] = None) -> bool:
+        """Sleep until the next tick.
+
+        Args:
+            stop: Optional; Event interrupting the sleep when set.
+
+        Returns:
+            False if interrupted by `stop`, True otherwise.
+
+        Raises:
+            None.
+        """
+
+        period = 1 / self.rate
+        now = time.monotonic()
+        if self._next is None or now - self._next > period:
+            self._next = now  # first tick, or late: skip the missed ones
+
+        delay = self._next - now
+        self._next += period
+        if delay <= 0:
+            return stop is None or not stop.is_set()
+        if stop is None:
+            time.sleep(delay)
+            return True
+        return not stop.wait(delay)
+
+
+class AdaptiveRate:
+    """Frame rate following the measured inference latency.
+
+    A worker answering in `latency` seconds with `in_flight` frames sent at
+    once processes about `in_flight / latency` frames per second: sending more
+    only gets them dropped. The rate is kept a bit below it (`headroom`), and
+    between `min_rate` and `max_rate`. The latency is smoothed with an
+    exponential moving average, so the rate goes back up when it improves.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 1.0,
+        in_flight: int = 1,
+        headroom: float = 0.9,
+        smoothing: float = 0.2,
+    ):
+        """Initialize the controller, at the maximum rate.
+
+        Args:
+            max_rate: Maximum rate, in frames per second (like the camera one).
+            min_rate: Optional; Minimum rate, in frames per second.
+            in_flight: Optional; Number of frames sent while waiting for their
+                output.
+            headroom: Optional; Fraction of the estimated worker rate to target.
+            smoothing: Optional; Weight of a new latency in the moving average.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid rates.
+        """
+
+        if not 0 < min_rate <= max_rate:
+            raise ValueError(
+                f"Expected 0 < min_rate <= max_rate, got {min_rate} and {max_rate}"
+            )
+
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.in_flight = in_flight
+        self.headroom = headroom
+        self.smoothing = smoothing
+
+        self.rate = max_rate
+        self.latency: Optional[float] = None  # smoothed, in seconds
+
+    def update(self, latency: float) -> float:
+        """Update the rate with the latency of a frame.
+
+        Args:
+            latency: From the submission of the frame to its output, in seconds.
+
+        Returns:
+            The new rate, in frames per second.
+
+        Raises:
+            None.
+        """
+
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+        rate = self.headroom * self.in_flight / max(self.latency, 1e-6)
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        return self.rate
+
+
+class LiveSource:
+    """Run a model on a live source, like a camera, and display the outputs.
+
+    Frames are read in a capture thread paced by a `Pacer`, and submitted to a
+    latest-frame-wins `RealtimeStream`. With `adaptive`, an `AdaptiveRate`
+    lowers the capture rate to what the worker can process, so frames are not
+    captured and encoded only to be dropped. Outputs are displayed in their
+    own thread, the newest one only if the display is slower than the model.
+    """
+
+    def __init__(
+        self,
+        client: I2Client,
+        read: Callable[[], Tuple[bool, Any]],
+        display: Optional[Callable[[Any, Tuple[bool, Any]], Any]] = None,
+        max_fps: float = 15.0,
+        min_fps: float = 1.0,
+        adaptive: bool = True,
+        max_in_flight: int = 1,
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+    ):
+        """Initialize the live source.
+
+        Args:
+            client: Connected client used to send the frames.
+            read: Function reading a frame, returning whether it succeeded and
+                the frame, like `cv2.VideoCapture.read`. A failed read ends the
+                stream.
+            display: Optional; Function called in the display thread with each
+                frame and its output (the output tuple). Returning False ends
+                the stream.
+            max_fps: Optional; Maximum capture rate, in frames per second.
+            min_fps: Optional; Minimum capture rate of the adaptive mode.
+            adaptive: Optional; Lower the capture rate to the rate of the worker.
+            max_in_flight: Optional; Number of frames sent while waiting for
+                their output.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid rates or in-flight window.
+        """
+
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        self.client = client
+        self.read = read
+        self.display = display
+        self.max_in_flight = max_in_flight
+        self.encode = encode
+        self.decode = decode
+
+        self.pacer = Pacer(max_fps)
+        self.controller = (
+            AdaptiveRate(max_fps, min_fps, in_flight=max_in_flight)
+            if adaptive
+            else None
+        )
+        self.stream: Optional[RealtimeStream] = None
+
+        self.captured = 0  # frames read from the source and submitted
+        self.displayed = 0  # outputs displayed
+        self.error: Optional[BaseException] = None  # of the capture or display
+
+        self._stopping = threading.Event()
+        self._outputs: queue.Queue = queue.Queue(maxsize=1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def fps(self) -> float:
+        """Current capture rate, in frames per second."""
+        return self.pacer.rate
+
+    def stop(self):
+        """Stop the stream, from any thread.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._stopping.set()
+        loop, stream = self._loop, self.stream
+        if loop is not None and stream is not None:
+            asyncio.run_coroutine_threadsafe(stream.close(), loop)
+
+    async def run(self):
+        """Capture, send and display frames until the stream is stopped.
+
+        The stream stops when `stop` is called, the source fails to read a
+        frame, or the display function returns False.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: There was an error encoding or packing a frame.
+            ConnectionError: The connection was lost.
+            Exception: The error raised by `read` or `display`, if any.
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+
+        async with self.client.realtime(
+            self.encode, self.decode, self.max_in_flight
+        ) as stream:
+            self.stream = stream
+            threads = [threading.Thread(target=self._capture, name="i2-capture")]
+            if self.display is not None:
+                threads.append(
+                    threading.Thread(target=self._display, name="i2-display")
+                )
+            for thread in threads:
+                thread.start()
+
+            try:
+                async for frame, output in stream.outputs():
+                    if self.controller is not None:
+                        self.pacer.rate = self.controller.update(stream.latency)
+                    if self.display is not None:
+                        self._show(frame, output)
+            finally:
+                self._stopping.set()
+                for thread in threads:
+                    await self._loop.run_in_executor(None, thread.join)
+                self._loop = None
+
+        log.debug(
+            f"Live stream stopped: {self.captured} frames captured, "
+            + f"{stream.dropped} dropped, {self.displayed} displayed"
+        )
+        if self.error is not None:
+            raise self.error
+
+    def _capture(self):
+        """Read and submit frames at the pace of the rate."""
+
+        try:
+            while self.pacer.wait(self._stopping):
+                ok, frame = self.read()
+                if not ok:
+                    log.info("Live source ended")
+                    break
+                # stopped while reading: the stream may be closed already
+                if self._stopping.is_set() or not self.stream.submit(frame):  # type: ignore
+                    break
+                self.captured += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self.stop()
+
+    def _show(self, frame: Any, output: Tuple[bool, Any]):
+        """Hand an output to the display thread, replacing the undisplayed one."""
+
+        try:
+            self._outputs.get_nowait()
+        except queue.Empty:
+            pass
+        self._outputs.put_nowait((frame, output))
+
+    def _display(self):
+        """Display the outputs as they come."""
+
+        try:
+            while not self._stopping.is_set():
+                try:
+                    frame, output = self._outputs.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                self.displayed += 1
+                if self.display(frame, output) is False:  # type: ignore
+                    break
+        except Exception as error:
+            self.error = error
+        finally:
+            self.stop()
@@ -0,0 +1,169 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .client import I2Client
+from .scheduler import TokenBucket
+
+log = logging.getLogger(__name__)
+
+
+class I2ClientPool:
+    """A pool of connections to the same model, balancing inferences between them."""
+
+    def __init__(self, url: str, access_key: str, size: int = 2, **kwargs):
+        """Initialize the pool of isquare clients.
+
+        Args:
+            url: Url of the model to use (provided on isquare.ai).
+            access_key: Access key for the model (generated on isquare.ai)
+            size: Optional; Number of connections to open.
+            kwargs: Optional; Other arguments given to each `I2Client`, like
+                `max_in_flight` or `batch_size`. A `rate_limit` is shared by the
+                clients, so it limits the total rate of the pool.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid pool size.
+        """
+
+        if size < 1:
+            raise ValueError(f"Pool size must be at least 1, got {size}")
+
+        rate_limit = kwargs.get("rate_limit")
+        if rate_limit is not None and not isinstance(rate_limit, TokenBucket):
+            kwargs["rate_limit"] = TokenBucket(rate_limit)
+
+        self.url = url
+        self.access_key = access_key
+        self.clients = [I2Client(url, access_key, **kwargs) for _ in range(size)]
+        self.loads = [0] * size
+
+    async def __aenter__(self):
+        """Async context manager enter, connecting all clients to archipel.
+
+        Args:
+            None.
+
+        Returns:
+            The pool, with all its clients connected.
+
+        Raises:
+            ConnectionError: There's a problem connecting to archipel with
+                the specified url/access key pair.
+        """
+
+        results = await asyncio.gather(
+            *[client.__aenter__() for client in self.clients], return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await asyncio.gather(
+                *[
+                    client.__aexit__(None, None, None)
+                    for client, result in zip(self.clients, results)
+                    if not isinstance(result, BaseException)
+                ]
+            )
+            raise errors[0]
+
+        log.info(f"Pool of {len(self.clients)} connections ready")
+
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        """Async context manager exit, closing all connections.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        await asyncio.gather(
+            *[client.__aexit__(*args, **kwargs) for client in self.clients]
+        )
+
+    def _least_loaded(self) -> int:
+        """Index of the connection with the fewest pending inputs."""
+        return min(range(len(self.clients)), key=self.loads.__getitem__)
+
+    async def async_inference(
+        self,
+        inputs: Any,
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: Optional[int] = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+    ) -> List[Tuple[bool, Any]]:
+        """Send inference to archipel in async way, spread over the connections.
+
+        Each input is assigned to the connection with the fewest pending inputs,
+        including the ones of concurrent calls to the pool.
+
+        Args:
+            inputs: The inputs to send to the workers.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Override the in-flight window of each client.
+            priority: Optional; Priority of the messages ("realtime", "normal"
+                or "bulk").
+            timeout: Optional; Deadline of the call, in seconds (overrides the
+                one of the clients).
+
+        Returns:
+            List of Tuple composed of two values: bool to indicate whether inference
+            is a success and the inference is success or an error message if fail.
+
+        Raises:
+            ValueError: There was an error encoding or packing the given
+                input (the specific error is printed).
+        """
+
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+
+        assignments: Dict[int, List[int]] = {}
+        for index in range(len(inputs)):
+            conn = self._least_loaded()
+            self.loads[conn] += 1
+            assignments.setdefault(conn, []).append(index)
+
+        async def _inference(conn: int, indices: List[int]):
+            try:
+                return await self.clients[conn].async_inference(
+                    [inputs[index] for index in indices],
+                    encode,
+                    decode,
+                    max_in_flight,
+                    priority=priority,
+                    timeout=timeout,
+                )
+            finally:
+                self.loads[conn] -= len(indices)
+
+        results = await asyncio.gather(
+            *[_inference(conn, indices) for conn, indices in assignments.items()]
+        )
+
+        outputs: List[Tuple[bool, Any]] = [None] * len(inputs)  # type: ignore
+        for indices, result in zip(assignments.values(), results):
+            for index, output in zip(indices, result):
+                outputs[index] = output
+
+        return outputs
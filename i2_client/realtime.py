@@ -0,0 +1,256 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client import I2Client
+
+log = logging.getLogger(__name__)
+
+
+class RealtimeStream:
+    """Latest-frame-wins inference of a live source, like a camera.
+
+    Frames are submitted as they are captured, at most one waits to be sent:
+    a newer frame replaces it, so a slow worker makes the stream drop frames
+    instead of queueing them, and the latency from capture to output stays
+    bounded by the inference time. Outputs are also latest-wins: an output not
+    consumed yet is replaced by a newer one.
+    """
+
+    def __init__(
+        self,
+        client: "I2Client",
+        encode: Optional[Callable] = None,
+        decode: Optional[Callable] = None,
+        max_in_flight: int = 1,
+        priority: str = "realtime",
+        timeout: Optional[float] = None,
+        history: int = 100,
+    ):
+        """Initialize the stream.
+
+        Args:
+            client: Connected client used to send the frames.
+            encode: Optional; Specify a specific input encoding.
+            decode: Optional; Specify a specific output decoding.
+            max_in_flight: Optional; Number of frames sent while waiting for
+                their output. More than 1 hides the network latency, at the
+                cost of a load on the worker.
+            priority: Optional; Priority of the frames on the client.
+            timeout: Optional; Deadline of each frame, in seconds.
+            history: Optional; Number of recent latencies kept.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid in-flight window.
+        """
+
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        self.client = client
+        self.encode = encode
+        self.decode = decode
+        self.max_in_flight = max_in_flight
+        self.priority = priority
+        self.timeout = timeout
+
+        self.submitted = 0  # frames submitted
+        self.dropped = 0  # frames replaced by a newer one before being sent
+        self.completed = 0  # frames with an output
+        self.stale = 0  # outputs replaced by a newer one before being consumed
+        # from the submission of the frames to their output, in seconds
+        self.latencies: Deque[float] = deque(maxlen=history)
+
+        self._lock = threading.Lock()
+        self._frame: Optional[Tuple[int, float, Any]] = None
+        self._output: Optional[Tuple[Any, Tuple[bool, Any]]] = None
+        self._delivered = 0  # sequence number of the newest output
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._senders: List[asyncio.Task] = []
+
+    @property
+    def latency(self) -> float:
+        """Latency of the last output, from the submission of its frame."""
+        return self.latencies[-1] if self.latencies else 0.0
+
+    async def __aenter__(self):
+        """Async context manager enter, starting to send the frames.
+
+        Args:
+            None.
+
+        Returns:
+            The stream.
+
+        Raises:
+            None.
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._frame_ready = asyncio.Event()
+        self._output_ready = asyncio.Event()
+        self._senders = [
+            asyncio.ensure_future(self._send()) for _ in range(self.max_in_flight)
+        ]
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        """Async context manager exit, see `close`.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        await self.close()
+
+    def submit(self, frame: Any) -> bool:
+        """Submit a frame, replacing the one waiting to be sent, if any.
+
+        It does not block, and can be called from any thread.
+
+        Args:
+            frame: The frame to send to the worker.
+
+        Returns:
+            False if the stream is closed (the frame is not sent), True otherwise.
+
+        Raises:
+            RuntimeError: The stream is not started.
+        """
+
+        if self._loop is None:
+            raise RuntimeError("Realtime stream not started")
+        if self._closed:
+            return False
+
+        with self._lock:
+            self.submitted += 1
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = (self.submitted, time.perf_counter(), frame)
+
+        self._loop.call_soon_threadsafe(self._frame_ready.set)
+        return True
+
+    async def outputs(self) -> AsyncIterator[Tuple[Any, Tuple[bool, Any]]]:
+        """Iterate over the newest outputs, until the stream is closed.
+
+        Yields:
+            Tuple of the frame and its output: bool to indicate whether inference
+            is a success and the inference is success or an error message if
+            fail.
+
+        Raises:
+            ValueError: There was an error encoding or packing a frame.
+            ConnectionError: The connection was lost.
+        """
+
+        while True:
+            await self._output_ready.wait()
+            self._output_ready.clear()
+            if self._error is not None:
+                raise self._error
+
+            output, self._output = self._output, None
+            if output is not None:
+                yield output
+            elif self._closed:
+                return
+
+    async def close(self):
+        """Stop sending frames, and end the iteration over the outputs.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._closed = True
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        if self._loop is not None:
+            self._output_ready.set()
+
+    async def _send(self):
+        """Send the newest frame once the previous output is received."""
+
+        while True:
+            await self._frame_ready.wait()
+            with self._lock:
+                frame, self._frame = self._frame, None
+                self._frame_ready.clear()
+            if frame is None:
+                continue  # taken by another sender
+
+            sequence, submitted_at, inp = frame
+            try:
+                [output] = await self.client.async_inference(
+                    inp,
+                    self.encode,
+                    self.decode,
+                    priority=self.priority,
+                    timeout=self.timeout,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self._error = error
+                self._output_ready.set()
+                return
+
+            self._deliver(sequence, submitted_at, inp, output)
+
+    def _deliver(
+        self, sequence: int, submitted_at: float, inp: Any, output: Tuple[bool, Any]
+    ):
+        """Make an output the newest one, unless a newer frame has one."""
+
+        self.completed += 1
+        if sequence < self._delivered:
+            self.stale += 1
+            return
+
+        if self._output is not None:
+            self.stale += 1
+        self._delivered = sequence
+        self._output = (inp, output)
+        self.latencies.append(time.perf_counter() - submitted_at)
+        self._output_ready.set()
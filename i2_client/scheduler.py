@@ -0,0 +1,208 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# send priorities, the lower level is sent first
+PRIORITIES = {"realtime": 0, "normal": 1, "bulk": 2}
+
+
+def priority_level(priority: str) -> int:
+    """Level of a priority of `PRIORITIES`.
+
+    Args:
+        priority: Name of the priority.
+
+    Returns:
+        The level, lower is sent first.
+
+    Raises:
+        ValueError: Unknown priority.
+    """
+
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority}, among {[*PRIORITIES]}")
+    return PRIORITIES[priority]
+
+
+class TokenBucket:
+    """Token bucket limiting a rate of requests, with bursts.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate` tokens
+    per second, each request takes one. It can be shared by several clients
+    (like the connections of a pool) to limit their total rate, as long as
+    they use the same event loop.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """Initialize the bucket, full.
+
+        Args:
+            rate: Requests per second.
+            burst: Optional; Maximum number of requests sent at once after an
+                idle period. If none, one second of requests (at least 1).
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Invalid rate or burst.
+        """
+
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        burst = max(1, round(rate)) if burst is None else burst
+        if burst < 1:
+            raise ValueError(f"burst must be at least 1, got {burst}")
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token, if there is one.
+
+        Args:
+            None.
+
+        Returns:
+            0 if a token was taken, otherwise the delay until one is available,
+            in seconds.
+
+        Raises:
+            None.
+        """
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SendGate:
+    """In-flight slots of a client, granted by priority within a rate limit.
+
+    Requests wait for a free slot and, with a token bucket, for a token.
+    Waiting requests are granted in priority order, then in arrival order, so
+    realtime requests jump ahead of the normal and bulk ones queued before
+    them. It is used like a semaphore: `release` frees the slot.
+    """
+
+    def __init__(self, slots: int, bucket: Optional[TokenBucket] = None):
+        """Initialize the gate.
+
+        Args:
+            slots: Number of requests granted at the same time.
+            bucket: Optional; Token bucket limiting the rate of the grants.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.bucket = bucket
+        # number of requests granted, and of the ones which had to wait, by priority
+        self.granted: Counter = Counter()
+        self.queued: Counter = Counter()
+        self._free = slots
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting to be granted."""
+        return sum(not future.done() for *_, future in self._waiters)
+
+    async def acquire(self, priority: str = "normal"):
+        """Wait for a slot, and a token if rate limited.
+
+        Args:
+            priority: Optional; Priority of the request, among `PRIORITIES`.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: Unknown priority.
+        """
+
+        level = priority_level(priority)
+        if not self._waiters and self._free > 0 and self._take():
+            self._free -= 1
+            self.granted[priority] += 1
+            return
+
+        self.queued[priority] += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._order), priority, future))
+        self._wake()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                self.release()  # granted, but the caller is gone
+            else:
+                self._wake()  # it may have been the first waiter
+            raise
+
+    def release(self):
+        """Free a slot, granted to the first waiting request, if any."""
+
+        self._free += 1
+        self._wake()
+
+    def _take(self) -> bool:
+        """Take a token, or schedule a new attempt once there is one."""
+
+        if self.bucket is None:
+            return True
+
+        delay = self.bucket.take()
+        if delay <= 0:
+            return True
+
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(delay, self._retry)
+        return False
+
+    def _retry(self):
+        """Grant the waiting requests once a token is available."""
+        self._timer = None
+        self._wake()
+
+    def _wake(self):
+        """Grant the waiting requests by priority, while possible."""
+
+        while self._waiters:
+            _, _, priority, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._free < 1 or not self._take():
+                return
+
+            heapq.heappop(self._waiters)
+            self._free -= 1
+            self.granted[priority] += 1
+            future.set_result(None)
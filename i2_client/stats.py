@@ -0,0 +1,152 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import math
+import sys
+from collections import deque
+from typing import Deque, Dict, List, Sequence
+
+PHASES = ["queue", "encode", "pack", "send", "wait", "unpack", "decode", "total"]
+SIZES = ["bytes_sent", "bytes_received", "unbuffered_bytes"]
+
+
+class RequestTiming:
+    """Durations (in seconds) and payload sizes of one request to the worker.
+
+    A request is one message: a single input, or a batch of inputs.
+    """
+
+    def __init__(self, size: int = 1):
+        self.size = size  # number of inputs in the message
+        # waiting for the in-flight window and the rate limit, not in the total
+        self.queue = 0.0
+        self.encode = 0.0
+        self.pack = 0.0
+        self.send = 0.0
+        self.wait = 0.0  # from the end of the send to the reception of the response
+        self.unpack = 0.0
+        self.decode = 0.0
+        self.total = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # output arrays not written into a caller buffer (`out`); decoding still
+        # allocates temporaries (received bytes, decoded images) for all outputs
+        self.unbuffered_outputs = 0
+        self.unbuffered_bytes = 0
+
+    def __repr__(self):
+        """Representation with all durations and sizes."""
+        phases = ", ".join(f"{phase}={getattr(self, phase):.6f}" for phase in PHASES)
+        return (
+            f"RequestTiming(size={self.size}, {phases}, "
+            + f"bytes_sent={self.bytes_sent}, bytes_received={self.bytes_received}, "
+            + f"unbuffered_outputs={self.unbuffered_outputs}, "
+            + f"unbuffered_bytes={self.unbuffered_bytes})"
+        )
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of values (0 if empty)."""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ClientStats:
+    """Statistics of the requests of a client, over a sliding history."""
+
+    def __init__(self, history: int = 10000):
+        """Initialize the statistics.
+
+        Args:
+            history: Optional; Number of recent requests kept for the percentiles.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.history = history
+        self.reset()
+
+    def record(self, timing: RequestTiming):
+        """Record the timing of a completed request."""
+
+        self.timings.append(timing)
+        self.requests += 1
+        self.inputs += timing.size
+        self.bytes_sent += timing.bytes_sent
+        self.bytes_received += timing.bytes_received
+        self.unbuffered_outputs += timing.unbuffered_outputs
+        self.unbuffered_bytes += timing.unbuffered_bytes
+
+    def reset(self):
+        """Forget all recorded requests."""
+
+        self.timings: Deque[RequestTiming] = deque(maxlen=self.history)
+        self.requests = 0
+        self.inputs = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.unbuffered_outputs = 0
+        self.unbuffered_bytes = 0
+        # requests cancelled because their deadline was exceeded, and responses
+        # received after their request was cancelled (discarded)
+        self.deadline_misses = 0
+        self.late_responses = 0
+
+    @property
+    def peak_rss(self) -> int:
+        """Peak resident memory of the process, in bytes (0 if unknown)."""
+
+        try:
+            import resource
+        except ModuleNotFoundError:  # pragma: no cover
+            return 0
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def summary(
+        self, percentiles: Sequence[float] = (50, 95, 99)
+    ) -> Dict[str, Dict[str, float]]:
+        """Summarize the durations of each phase and the payload sizes.
+
+        Args:
+            percentiles: Optional; Percentiles to compute.
+
+        It can be called from any thread.
+
+        Returns:
+            For each phase (and each of `SIZES`), the mean, the max and the
+            given percentiles (as `p50`, `p95`, ...) over the history.
+
+        Raises:
+            None.
+        """
+
+        # snapshot, so the stats can be read from another thread while recorded
+        timings = list(self.timings)
+        summary = {}
+        for field in PHASES + SIZES:
+            values: List[float] = [getattr(timing, field) for timing in timings]
+            stats = {
+                "mean": sum(values) / len(values) if values else 0.0,
+                "max": max(values, default=0.0),
+            }
+            for q in percentiles:
+                stats[f"p{q:g}"] = percentile(values, q)
+            summary[field] = stats
+
+        return summary
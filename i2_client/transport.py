@@ -0,0 +1,112 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import logging
+import socket
+from typing import Any, Dict, Union
+
+from websockets.legacy.client import Connect
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGE_SIZE = 2**50
+
+# websocket options of each transport profile, over the websockets defaults
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # the websockets defaults, with permessage-deflate compression
+    "default": {},
+    # large payloads (arrays): no compression, which burns CPU on incompressible
+    # data, and large buffers so big messages are not split in many writes
+    "throughput": {
+        "compression": None,
+        "max_queue": 64,
+        "read_limit": 2**22,
+        "write_limit": 2**22,
+        "nodelay": True,
+    },
+    # small payloads: no compression, small buffers flushed right away, and
+    # frequent pings to detect a lost connection quickly
+    "low-latency": {
+        "compression": None,
+        "max_queue": 16,
+        "read_limit": 2**16,
+        "write_limit": 2**14,
+        "ping_interval": 5,
+        "ping_timeout": 5,
+        "nodelay": True,
+    },
+    # slow links: compress, let TCP coalesce small writes, and ping rarely
+    "constrained-bandwidth": {
+        "compression": "deflate",
+        "max_queue": 16,
+        "read_limit": 2**16,
+        "write_limit": 2**16,
+        "ping_interval": 60,
+        "ping_timeout": 60,
+        "nodelay": False,
+    },
+}
+
+# profiles compared by the auto mode
+AUTO_PROFILES = ["throughput", "low-latency", "constrained-bandwidth"]
+
+OPTIONS = [
+    "compression",
+    "max_queue",
+    "read_limit",
+    "write_limit",
+    "ping_interval",
+    "ping_timeout",
+    "close_timeout",
+    "nodelay",
+]
+
+
+def transport_options(transport: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Get the websocket options of a transport.
+
+    Args:
+        transport: Name of a profile of `PROFILES`, or options (among `OPTIONS`)
+            overriding the websockets defaults.
+
+    Returns:
+        The options.
+
+    Raises:
+        ValueError: Unknown profile or option.
+    """
+
+    if isinstance(transport, dict):
+        unknown = set(transport) - set(OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown transport options {unknown}, among {OPTIONS}")
+        return dict(transport)
+
+    if transport not in PROFILES:
+        raise ValueError(f"Unknown transport profile {transport}, among {[*PROFILES]}")
+    return dict(PROFILES[transport])
+
+
+def connect(url: str, options: Dict[str, Any]) -> Connect:
+    """Prepare a websocket connection with transport options, see `apply`."""
+
+    options = {k: v for k, v in options.items() if k != "nodelay"}
+    return Connect(url, max_size=MAX_MESSAGE_SIZE, **options)
+
+
+def apply(websocket: Any, options: Dict[str, Any]):
+    """Apply the socket level options to an opened websocket."""
+
+    if options.get("nodelay") is None:
+        return
+
+    sock = websocket.transport.get_extra_info("socket")
+    if sock is None or sock.family not in [socket.AF_INET, socket.AF_INET6]:
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(options["nodelay"]))
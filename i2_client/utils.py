@@ -8,13 +8,13 @@ permission, please contact the copyright holders and delete this file.
 """
 import json
 from pathlib import Path, PosixPath
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-import cv2
-import numpy as np
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
 
 
-def open_file(file: Union[str, PosixPath]) -> Union[str, np.ndarray, dict]:
+def open_file(file: Union[str, PosixPath]) -> Union[str, "np.ndarray", dict]:
     """Opens any file before sending to an archipel.
 
     Currently supported files: Text (.txt), JSON (.json) and images (.png,.jpeg & .jpg).
@@ -37,6 +37,8 @@ def open_file(file: Union[str, PosixPath]) -> Union[str, np.ndarray, dict]:
     img_extensions = [".png", ".jpeg", ".jpg"]
     suffix = Path(file).suffix
     if suffix in img_extensions:
+        import cv2  # slow to import, only when needed
+
         return cv2.imread(file)
     elif suffix == ".txt":
         with open(file) as f:
@@ -50,7 +52,9 @@ def open_file(file: Union[str, PosixPath]) -> Union[str, np.ndarray, dict]:
         raise RuntimeError("Invalid file format specified.")
 
 
-def save_file(data: Union[str, np.ndarray, dict], path: Union[str, PosixPath]) -> None:
+def save_file(
+    data: Union[str, "np.ndarray", dict], path: Union[str, PosixPath]
+) -> None:
     """Save a file in any format.
 
     Currently supported files: Text (.txt), JSON (.json) and images (.png,.jpeg & .jpg).
@@ -65,6 +69,8 @@ def save_file(data: Union[str, np.ndarray, dict], path: Union[str, PosixPath]) -
     Raises:
         RuntimeError: Unsupported extension or invalid datatype/extension combination.
     """
+    import numpy as np
+
     if isinstance(path, PosixPath):
         path = str(path)
     suffix = Path(path).suffix
@@ -77,6 +83,8 @@ def save_file(data: Union[str, np.ndarray, dict], path: Union[str, PosixPath]) -
         with open(path, "w") as f:
             json.dump(data, f)
     elif suffix in [".png", ".jpeg", ".jpg"] and isinstance(data, np.ndarray):
+        import cv2
+
         cv2.imwrite(path, data)
     else:
         if suffix in [".png", ".jpeg", ".jpg", ".txt", ".json"]:
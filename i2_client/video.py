@@ -0,0 +1,293 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional, Tuple, Union
+
+from .client import I2Client
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FPS = 25.0  # when the source does not tell its frame rate
+DEFAULT_FOURCC = "mp4v"
+
+_END = object()
+
+
+class VideoInfo:
+    """Frame rate, resolution and number of frames of a video."""
+
+    def __init__(self, fps: float, width: int, height: int, frames: int):
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.frames = frames  # as told by the container, may be 0 or approximate
+
+    def __repr__(self):
+        """Representation with all fields."""
+        return (
+            f"VideoInfo(fps={self.fps:g}, width={self.width}, height={self.height}, "
+            + f"frames={self.frames})"
+        )
+
+
+class _Decoder(threading.Thread):
+    """Read the frames of a video in a thread, in a bounded queue."""
+
+    def __init__(self, path: str, size: int):
+        super().__init__(name="i2-video-decoder", daemon=True)
+
+        import cv2
+
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Error opening video {path}")
+
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.info = VideoInfo(
+            fps if fps and fps > 0 else DEFAULT_FPS,
+            int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            max(0, int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))),
+        )
+        self.frames: queue.Queue = queue.Queue(maxsize=size)
+        self._stopping = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopping.is_set():
+                ok, frame = self.capture.read()
+                if not ok:
+                    break
+                self._put(frame)
+        except Exception as error:
+            self._put(error)
+        finally:
+            self.capture.release()
+            self._put(_END)
+
+    def _put(self, item: Any):
+        """Put an item in the queue, unless stopped."""
+
+        while not self._stopping.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self) -> Iterator["np.ndarray"]:
+        """Iterate over the decoded frames."""
+
+        while True:
+            try:
+                item = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def stop(self):
+        """Stop decoding, and wait for the thread."""
+        self._stopping.set()
+        self.join()
+
+
+class _Encoder(threading.Thread):
+    """Write frames to a video in a thread, from a bounded queue."""
+
+    def __init__(self, path: str, info: VideoInfo, fourcc: str, size: int):
+        super().__init__(name="i2-video-encoder", daemon=True)
+
+        import cv2
+
+        self.info = info
+        self.writer = cv2.VideoWriter(
+            path, cv2.VideoWriter.fourcc(*fourcc), info.fps, (info.width, info.height)
+        )
+        if not self.writer.isOpened():
+            raise ValueError(f"Error opening video writer {path} ({fourcc})")
+
+        self.frames: queue.Queue = queue.Queue(maxsize=size)
+        self.written = 0
+        self.error: Optional[Exception] = None
+
+    def run(self):
+        import cv2
+
+        size = (self.info.width, self.info.height)
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is _END:
+                    break
+                if self.error is not None:
+                    continue  # drain the queue, so the pipeline is not blocked
+                if frame.ndim == 2:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                if frame.shape[1::-1] != size:
+                    frame = cv2.resize(frame, size)
+                self.writer.write(frame)
+                self.written += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self.writer.release()
+
+
+def _check_output(index: int, output: Tuple[bool, Any]) -> "np.ndarray":
+    """Get the output frame of an inference, or raise an error."""
+
+    import numpy as np
+
+    success, frame = output
+    if not success:
+        raise RuntimeError(f"Inference failed on frame {index}: {frame}")
+    if (
+        not isinstance(frame, np.ndarray)
+        or frame.dtype != np.uint8
+        or frame.ndim not in [2, 3]
+        or (frame.ndim == 3 and frame.shape[2] != 3)
+    ):
+        raise ValueError(f"Output of frame {index} is not an image, can not write it")
+    return frame
+
+
+async def async_process_video(
+    client: I2Client,
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    max_in_flight: int = 8,
+    fourcc: str = DEFAULT_FOURCC,
+    on_frame: Optional[Callable[[int, VideoInfo], None]] = None,
+) -> VideoInfo:
+    """Run a model on every frame of a video, and write the output video.
+
+    Frames are decoded in a thread, sent by the client with up to
+    `max_in_flight` frames waiting for their output, put back in order and
+    written in another thread, so the throughput is not capped at one frame
+    per round trip. The output video keeps the frame rate and resolution of
+    the source (outputs of another size are resized).
+
+    Args:
+        client: Connected client of an image to image model, its own
+            in-flight window still applies.
+        input_path: Path of the source video.
+        output_path: Path of the output video.
+        max_in_flight: Optional; Number of frames sent while waiting for their
+            output.
+        fourcc: Optional; Codec of the output video.
+        on_frame: Optional; Function called with the number of frames written
+            so far and the source info, after each frame.
+
+    Returns:
+        The info of the source video, with the number of frames processed.
+
+    Raises:
+        ValueError: The video can not be read or written, or an output is not
+            an image.
+        RuntimeError: The inference of a frame failed.
+        ConnectionError: The connection was lost.
+    """
+
+    decoder = _Decoder(str(input_path), size=2 * max_in_flight)
+    info = decoder.info
+    log.info(f"Processing {input_path}: {info}")
+
+    try:
+        encoder = _Encoder(str(output_path), info, fourcc, size=2 * max_in_flight)
+    except BaseException:
+        decoder.capture.release()
+        raise
+
+    loop = asyncio.get_running_loop()
+    decoder.start()
+    encoder.start()
+    count = 0
+    outputs = client.stream(decoder, max_in_flight=max_in_flight)
+    try:
+        async for output in outputs:
+            frame = _check_output(count, output)
+            await loop.run_in_executor(None, encoder.frames.put, frame)
+            count += 1
+            if encoder.error is not None:
+                raise ValueError(f"Error writing video: {encoder.error}")
+            if on_frame is not None:
+                on_frame(count, info)
+    finally:
+        await outputs.aclose()
+        await loop.run_in_executor(None, decoder.stop)
+        await loop.run_in_executor(None, encoder.frames.put, _END)
+        await loop.run_in_executor(None, encoder.join)
+
+    if encoder.error is not None:
+        raise ValueError(f"Error writing video: {encoder.error}")
+
+    log.info(f"{count} frames processed, saved at {output_path}")
+    return VideoInfo(info.fps, info.width, info.height, count)
+
+
+def process_video(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    url: str,
+    access_key: str,
+    max_in_flight: int = 8,
+    fourcc: str = DEFAULT_FOURCC,
+    on_frame: Optional[Callable[[int, VideoInfo], None]] = None,
+    **kwargs,
+) -> VideoInfo:
+    """Run a model on every frame of a video, and write the output video.
+
+    See `async_process_video`.
+
+    Args:
+        input_path: Path of the source video.
+        output_path: Path of the output video.
+        url: Url of the model to use (provided on isquare.ai).
+        access_key: Access key for the model (generated on isquare.ai)
+        max_in_flight: Optional; Number of frames sent while waiting for their
+            output.
+        fourcc: Optional; Codec of the output video.
+        on_frame: Optional; Function called with the number of frames written
+            so far and the source info, after each frame.
+        kwargs: Optional; Other arguments given to the `I2Client`, like
+            `codecs` or `batch_size`.
+
+    Returns:
+        The info of the source video, with the number of frames processed.
+
+    Raises:
+        ValueError: The video can not be read or written, or an output is not
+            an image.
+        RuntimeError: The inference of a frame failed.
+        ConnectionError: There's a problem connecting to archipel, or the
+            connection was lost.
+    """
+
+    async def _process():
+        kwargs.setdefault("max_in_flight", max_in_flight)
+        async with I2Client(url, access_key, **kwargs) as client:
+            return await async_process_video(
+                client, input_path, output_path, max_in_flight, fourcc, on_frame
+            )
+
+    return asyncio.run(_process())
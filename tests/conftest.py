@@ -6,9 +6,15 @@ This file is confidential and only available to authorized individuals with the
 permission of the copyright holders. If you encounter this file and do not have
 permission, please contact the copyright holders and delete this file.
 """
+import asyncio
 import shutil
+import socket
+import threading
+from contextlib import closing
 
+import msgpack
 import pytest
+from websockets.server import serve as ws_serve
 
 
 @pytest.fixture()
@@ -16,3 +22,92 @@ def delete_zbeul_dir():
     """Remove test directory if used."""
     yield
     shutil.rmtree("zbeul")
+
+
+def _get_available_port() -> int:
+    """Return an available port on host."""
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(("", 0))
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        return s.getsockname()[1]
+
+
+async def _close_all_tasks():
+    """Close all asyncio running tasks, except the current one."""
+    for task in asyncio.all_tasks():
+        if task is asyncio.current_task():
+            continue
+        task.cancel()
+        try:
+            # Wait until task is cancelled
+            await task
+        except (asyncio.exceptions.CancelledError, RuntimeError):
+            pass
+
+
+async def register(websocket, input_type: str = "str", output_type: str = "str", **kw):
+    """Answer the registration of a fake user, with optional advertised fields."""
+    await websocket.recv()
+    data = {"input_type": input_type, "output_type": output_type}
+    await websocket.send(msgpack.packb({"status": "Success", "data": data, **kw}))
+
+
+@pytest.fixture
+def serve():
+    """Run a fake user against a fake archipel daemon.
+
+    The fake user coroutine function receives the url of the fake daemon.
+    """
+
+    async def _serve(fake_user, fake_daemon, timeout: float = 5.0):
+        host = "127.0.0.1"
+        port = _get_available_port()
+        start_server = ws_serve(fake_daemon, host, port)
+
+        async def _fake_user():
+            await asyncio.sleep(0.1)
+            await fake_user(f"ws://{host}:{port}")
+
+        try:
+            gather = asyncio.gather(_fake_user(), start_server)
+            await asyncio.wait_for(gather, timeout=timeout)
+        finally:
+            await _close_all_tasks()
+
+    return _serve
+
+
+@pytest.fixture
+def serve_in_thread():
+    """Run fake archipel daemons in background threads, for synchronous users.
+
+    Returns a function starting a daemon and returning its url.
+    """
+
+    servers = []
+
+    def _serve(fake_daemon) -> str:
+        host = "127.0.0.1"
+        port = _get_available_port()
+        started = threading.Event()
+        state = {}
+
+        async def _main():
+            state["loop"] = asyncio.get_running_loop()
+            state["stop"] = asyncio.Event()
+            async with ws_serve(fake_daemon, host, port):
+                started.set()
+                await state["stop"].wait()
+
+        thread = threading.Thread(target=asyncio.run, args=(_main(),), daemon=True)
+        thread.start()
+        started.wait(timeout=5.0)
+        servers.append((state, thread))
+
+        return f"ws://{host}:{port}"
+
+    yield _serve
+
+    for state, thread in servers:
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        thread.join(timeout=5.0)
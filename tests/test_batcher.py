@@ -0,0 +1,134 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client, MicroBatcher
+
+
+def test_init():
+    """Test micro-batcher initialization."""
+    client = I2Client("", "")
+    MicroBatcher(client)
+    with pytest.raises(ValueError):
+        MicroBatcher(client, max_batch_size=0)
+    with pytest.raises(ValueError):
+        MicroBatcher(client, max_wait_ms=-1)
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher(serve):
+    """Test concurrent calls are sent in batches and get their own output."""
+
+    messages = []
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", batch_size=16) as client:
+            async with MicroBatcher(
+                client, max_wait_ms=50, max_batch_size=16
+            ) as batcher:
+                # alone, sent right away
+                assert await batcher.infer("first") == (True, "FIRST")
+                assert messages == [1]
+
+                inputs = [f"input {i}" for i in range(40)]
+                outputs = await asyncio.gather(*[batcher.infer(i) for i in inputs])
+                assert outputs == [(True, inp.upper()) for inp in inputs]
+
+            assert batcher.inputs == 41
+            assert batcher.batches == len(messages) < 10
+            assert max(messages) == 16
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, features={"batch": 16})
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await asyncio.sleep(0.01)
+            if drecv["action"] == "Inference":
+                messages.append(1)
+                response = {"status": "Success", "data": drecv["data"].upper()}
+            else:
+                messages.append(len(drecv["data"]))
+                outputs = [
+                    {"status": "Success", "data": inp.upper()} for inp in drecv["data"]
+                ]
+                response = {"status": "Success", "data": outputs}
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_errors(serve):
+    """Test errors are routed to all the callers of a batch."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            batcher = MicroBatcher(client, max_wait_ms=1000)
+            calls = [asyncio.ensure_future(batcher.infer(0))]
+            await asyncio.sleep(0.05)
+            calls += [asyncio.ensure_future(batcher.infer(i)) for i in range(1, 3)]
+            await asyncio.sleep(0.05)
+
+            print("The first one is sent, the others wait for it")
+            await batcher.close()
+            results = await asyncio.gather(*calls, return_exceptions=True)
+            assert isinstance(results[0], ConnectionError)
+            assert all(isinstance(result, RuntimeError) for result in results[1:])
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, "str", "str")
+        await websocket.recv()
+        await asyncio.sleep(0.2)
+        await websocket.close()
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_invalid_input(serve):
+    """Test an input which can not be packed only fails its own call."""
+
+    received = []
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            async with MicroBatcher(client, max_wait_ms=1000) as batcher:
+                first = asyncio.ensure_future(batcher.infer("x"))
+                await asyncio.sleep(0.05)
+                # batched together while the first one is sent
+                results = await asyncio.gather(
+                    batcher.infer("a"),
+                    batcher.infer(object()),
+                    batcher.infer("c"),
+                    return_exceptions=True,
+                )
+                assert await first == (True, "x")
+
+            assert results[0] == (True, "a") and results[2] == (True, "c")
+            assert isinstance(results[1], ValueError)
+            assert batcher.batches == 2
+            # the valid inputs of the failed batch may have been sent already
+            assert set(received) == {"a", "c", "x"}
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, "str", "str")
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            await asyncio.sleep(0.1)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
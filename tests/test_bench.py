@@ -0,0 +1,78 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client
+from i2_client.bench import BenchResult, run_bench
+
+
+def test_bench_result():
+    """Test the histogram and the summary of a load test."""
+
+    result = BenchResult()
+    assert result.histogram() == [] and result.throughput == 0.0
+
+    result.latencies = [0.001 * i for i in range(1, 101)]
+    result.errors["zbl"] = 25
+    result.duration = 5.0
+
+    histogram = result.histogram(buckets=5)
+    assert len(histogram) == 5
+    assert sum(count for _, _, count in histogram) == 100
+    assert histogram[0][0] == 0.001 and histogram[-1][1] == 0.1
+
+    summary = result.summary()
+    assert summary["requests"] == 125
+    assert summary["error_rate"] == 0.2
+    assert summary["throughput"] == 25.0
+    assert summary["latency_ms"]["p50"] == 50.0
+    assert summary["latency_ms"]["max"] == 100.0
+
+    report = result.report()
+    assert "p99.9" in report and "25 x zbl" in report
+
+
+@pytest.mark.asyncio
+async def test_run_bench(serve):
+    """Test closed loop and target rate load tests."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=4) as client:
+            result = await run_bench(
+                client, "a", concurrency=4, duration=0.5, warmup=0.1
+            )
+            assert result.requests > 20
+            assert 0.15 < result.error_rate < 0.35  # one failure every 4 requests
+            assert abs(result.duration - 0.5) < 0.01
+
+            result = await run_bench(client, "a", concurrency=4, rate=50, duration=0.5)
+            assert 20 <= result.requests <= 28
+            assert all(latency >= 0.01 for latency in result.latencies)
+
+            with pytest.raises(ValueError):
+                await run_bench(client, "a", rate=0)
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        count = 0
+        async for recv in websocket:
+            await asyncio.sleep(0.01)
+            count += 1
+            if count % 4:
+                response = {"status": "Success", "data": "b"}
+            else:
+                response = {"status": "Fail", "message": "zbl"}
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)
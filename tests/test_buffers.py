@@ -0,0 +1,103 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import msgpack
+import numpy as np
+import pytest
+from conftest import register
+
+from i2_client import BufferPool, I2Client
+from i2_client.codecs import decode_array, encode_array
+
+
+def test_buffer_pool():
+    """Test arrays are recycled by shape and dtype."""
+
+    pool = BufferPool(max_free=1)
+    first = pool.acquire((4, 4), np.float32)
+    second = pool.acquire((4, 4), np.float32)
+    pool.release(first)
+    pool.release(second)  # over max_free, freed
+    assert pool.acquire((4, 4), "float32") is first
+    assert pool.acquire((4, 4), np.uint8) is not second
+
+    assert pool.allocations == 3 and pool.reuses == 1
+    assert pool.peak_bytes == 2 * first.nbytes
+    assert pool.bytes == first.nbytes + 16
+
+    with pytest.raises(ValueError):
+        pool.release(first[1:])
+
+
+def test_decode_array_out():
+    """Test decoding into a given array or a pool."""
+
+    array = np.random.rand(8, 6)
+    payload = msgpack.unpackb(msgpack.packb(encode_array(array, codecs=["raw"])))
+
+    out = np.empty_like(array)
+    assert decode_array(payload, out=out) is out
+    assert np.array_equal(out, array) and out.flags.writeable
+
+    pool = BufferPool()
+    decoded = decode_array(payload, out=pool)
+    pool.release(decoded)
+    assert decode_array(payload, out=pool) is decoded
+
+    with pytest.raises(ValueError):
+        decode_array(payload, out=np.empty((6, 8)))
+
+
+@pytest.mark.asyncio
+async def test_client_output_buffers(serve):
+    """Test outputs decoded into buffers are not counted as unbuffered."""
+
+    fake_data = np.random.randint(0, 255, (32, 32, 3), dtype=np.uint8)
+
+    async def fake_user(url):
+        pool = BufferPool()
+        async with I2Client(url, "good:access_key") as client:
+            [(success, output)] = await client.async_inference(fake_data)
+            assert success and client.stats.unbuffered_outputs == 1
+            assert client.stats.unbuffered_bytes == fake_data.nbytes
+
+            out = np.empty_like(fake_data)
+            [(success, output)] = await client.async_inference(fake_data, out=out)
+            assert success and output is out and np.array_equal(out, fake_data)
+
+            outs = [np.empty_like(fake_data) for _ in range(2)]
+            outputs = await client.async_inference([fake_data] * 2, out=outs)
+            assert [output for _, output in outputs] == outs
+            with pytest.raises(ValueError):
+                await client.async_inference([fake_data] * 2, out=out)
+
+            async for success, output in client.stream([fake_data] * 5, out=pool):
+                assert np.array_equal(output, fake_data)
+                pool.release(output)
+            assert pool.allocations == 1 and pool.reuses == 4
+
+            [(success, output)] = await client.async_inference(
+                fake_data, out=np.empty((2, 2))
+            )
+            assert not success and "Fail to decode output" in output
+
+            assert client.stats.unbuffered_outputs == 1
+            assert client.stats.requests == 10
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"codecs": ["raw"]}
+        )
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
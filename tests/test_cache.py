@@ -0,0 +1,222 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import msgpack
+import numpy as np
+import pytest
+from conftest import register
+
+from i2_client import DiskCache, I2Client, ResultCache
+from i2_client.cache import input_key
+from i2_client.codecs import decode_array, encode_raw
+
+
+def test_input_key():
+    """Test keys depend on the model and the input."""
+    key = input_key("ws://model", b"input")
+    assert key == input_key("ws://model", b"input")
+    assert key != input_key("ws://other", b"input")
+    assert key != input_key("ws://model", b"other")
+    assert key != input_key("ws://model", b"input", scope="access_key")
+
+    # buffers are hashed in place, like the raw codec data
+    array = np.arange(12, dtype=np.float32)
+    encoded = {"codec": "raw", "data": memoryview(array).cast("B")}
+    key = input_key("ws://model", encoded)
+    assert key == input_key("ws://model", {"codec": "raw", "data": array.tobytes()})
+    assert key != input_key("ws://model", {"codec": "raw", "data": b""})
+    assert input_key("ws://model", [1, "a"]) != input_key("ws://model", [1, "b"])
+    with pytest.raises(ValueError):
+        input_key("ws://model", {"data": object()})
+
+
+def test_result_cache_eviction():
+    """Test LRU eviction on the number of entries and the total size."""
+
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    cache.put("a", {"data": b"a" * 10})
+    cache.put("b", {"data": b"b" * 10})
+    assert cache.get("a") is not None  # b is now the least recently used
+    cache.put("c", {"data": b"c" * 10})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.hits == 3 and cache.misses == 1
+
+    cache.put("d", {"data": b"d" * 90})
+    assert cache.get("a") is None and len(cache) == 1
+    assert cache.size <= 100
+
+    cache.put("e", {"data": b"e" * 200})  # larger than the cache
+    assert cache.get("e") is None and cache.get("d") is not None
+
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0 and cache.hits == 0
+
+
+def test_disk_cache(tmp_path):
+    """Test disk cache entries, memory-mapped arrays and eviction."""
+
+    array = np.random.rand(64, 64)
+    response = {"status": "Success", "data": encode_raw(array)}
+
+    cache = DiskCache(tmp_path, max_bytes=3 * array.nbytes)
+    cache.put("a" * 32, response)
+    cache.put("b" * 32, {"status": "Success", "data": "text"})
+
+    cached = DiskCache(tmp_path).get("a" * 32)  # as another process
+    assert isinstance(cached["data"]["data"].obj, np.memmap)
+    decoded = decode_array(cached["data"])
+    assert np.array_equal(decoded, array)
+    assert cache.get("b" * 32) == {"status": "Success", "data": "text"}
+    assert cache.get("c" * 32) is None
+    assert cache.hits == 1 and cache.misses == 1
+
+    for key in ["c", "d", "e"]:
+        cache.put(key * 32, response)
+    assert cache.evictions > 0
+    assert cache.size <= cache.max_bytes
+    assert cache.get("e" * 32) is not None
+    assert cache.get("b" * 32) is None  # least recently used
+    assert not list(tmp_path.glob("*/*.tmp"))
+
+
+def _fill_disk_cache(directory, worker):
+    cache = DiskCache(directory, max_bytes=2**20)
+    for i in range(20):
+        array = np.full((32, 32), i, dtype=np.float32)
+        cache.put(f"{i:032d}", {"status": "Success", "data": encode_raw(array)})
+        cached = cache.get(f"{(i + worker) % 20:032d}")
+        if cached is not None:
+            assert decode_array(cached["data"]).mean() == (i + worker) % 20
+    return cache.hits
+
+
+def test_disk_cache_processes(tmp_path):
+    """Test several processes sharing the same disk cache."""
+
+    with ProcessPoolExecutor(4) as executor:
+        list(executor.map(_fill_disk_cache, [tmp_path] * 4, range(4)))
+
+    cache = DiskCache(tmp_path)
+    assert len(cache) == 20
+    for i in range(20):
+        assert decode_array(cache.get(f"{i:032d}")["data"]).mean() == i
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", [None, "process"])
+async def test_client_result_cache(serve, executor):
+    """Test cached inputs are not sent to the worker, and failures are not cached."""
+
+    received = []
+    fake_data = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    async def fake_user(url):
+        cache = ResultCache()
+        async with I2Client(
+            url, "good:access_key", cache=cache, executor=executor
+        ) as client:
+            outputs = await client.async_inference([fake_data, fake_data + 1, "fail"])
+            assert [success for success, _ in outputs] == [True, True, False]
+            assert np.array_equal(outputs[0][1], fake_data)
+
+            outputs = await client.async_inference([fake_data + 1, fake_data, "fail"])
+            assert [success for success, _ in outputs] == [True, True, False]
+            assert np.array_equal(outputs[0][1], fake_data + 1)
+            assert np.array_equal(outputs[1][1], fake_data)
+
+            # hits only, without request
+            [(success, output)] = await client.async_inference(fake_data)
+            assert success and np.array_equal(output, fake_data)
+
+        assert len(received) == 4
+        assert cache.hits == 3 and cache.misses == 4 and len(cache) == 2
+        assert client.stats.requests == 4
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"codecs": ["raw"]}
+        )
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            if drecv["data"] == "fail":
+                response = {"status": "Fail", "message": "Not an array"}
+            else:
+                response = {"status": "Success", "data": drecv["data"]}
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_client_disk_cache(serve, tmp_path):
+    """Test outputs cached on disk are reused by another client."""
+
+    received = []
+
+    async def fake_user(url):
+        for access_key in ["good:access_key", "good:access_key", "other:access_key"]:
+            cache = DiskCache(tmp_path)
+            async with I2Client(url, access_key, cache=cache) as client:
+                assert await client.async_inference(["a", "b"]) == [
+                    (True, "A"),
+                    (True, "B"),
+                ]
+
+        # another access key, another scope
+        assert sorted(received) == ["a", "a", "b", "b"]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            response = {"status": "Success", "data": drecv["data"].upper()}
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", [None, "process"])
+async def test_client_disk_cache_arrays(serve, tmp_path, executor):
+    """Test memory-mapped arrays cached on disk are decoded, with any executor."""
+
+    received = []
+    fake_data = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    async def fake_user(url):
+        for i in range(2):
+            async with I2Client(
+                url, "good:access_key", cache=DiskCache(tmp_path), executor=executor
+            ) as client:
+                # a hit and a miss the second time
+                outputs = await client.async_inference([fake_data, fake_data + i + 1])
+                assert all(success for success, _ in outputs)
+                assert np.array_equal(outputs[0][1], fake_data)
+                assert np.array_equal(outputs[1][1], fake_data + i + 1)
+
+        assert len(received) == 3
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"codecs": ["raw"]}
+        )
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            response = {"status": "Success", "data": drecv["data"]}
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)
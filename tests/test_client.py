@@ -15,6 +15,7 @@ import msgpack
 import numpy as np
 import pytest
 import websockets
+from conftest import register
 
 from i2_client import I2Client
 
@@ -268,3 +269,510 @@ async def test_archipel_client_connection_async_got_inference_fail(setup, mocker
 
     finally:
         await close_all_tasks()
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_connection_async_in_flight_window(setup):
+    """Test pipelined inferences keep the input order."""
+
+    url, host, port = setup
+    window = 4
+    inputs = [f"input {i}" for i in range(10)]
+
+    async def fake_user():
+        await asyncio.sleep(0.1)
+        async with I2Client(url, "good:access_key", max_in_flight=window) as client:
+            outputs = await client.async_inference(inputs)
+            assert outputs == [(True, inp) for inp in inputs]
+
+    async def fake_daemon(websocket, path):
+        await websocket.recv()
+        msg = msgpack.packb(
+            {
+                "status": "Success",
+                "data": {"input_type": "str", "output_type": "str"},
+            }
+        )
+        await websocket.send(msg)
+
+        # only answer once the whole window has been received
+        remaining = len(inputs)
+        while remaining > 0:
+            pending = [await websocket.recv() for _ in range(min(window, remaining))]
+            for recv in pending:
+                drecv = msgpack.unpackb(recv)
+                msg = msgpack.packb({"status": "Success", "data": drecv["data"]})
+                await websocket.send(msg)
+            remaining -= len(pending)
+
+    start_server = websockets.serve(fake_daemon, host, port)
+
+    try:
+        gather = asyncio.gather(fake_user(), start_server)
+        await asyncio.wait_for(gather, timeout=5.0)
+
+    finally:
+        await close_all_tasks()
+
+
+def test_archipel_client_sync_session(serve_in_thread):
+    """Test a synchronous session registers once for several inferences."""
+
+    registrations = []
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        registrations.append(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    url = serve_in_thread(fake_daemon)
+
+    with I2Client(url, "good:access_key") as client:
+        for i in range(3):
+            assert client.inference(f"input {i}") == [(True, f"input {i}")]
+        assert client.open() is client
+    assert len(registrations) == 1
+
+    client.close()  # already closed, nothing to do
+
+    client.open()
+    assert client.inference(["a", "b"], max_in_flight=2) == [(True, "a"), (True, "b")]
+    client.close()
+    assert len(registrations) == 2
+
+
+def test_archipel_client_sync_session_invalid_access(serve_in_thread):
+    """Test a refused synchronous session does not stay open."""
+
+    async def fake_daemon(websocket, path):
+        await websocket.recv()
+        await websocket.send(msgpack.packb({"status": "Fail", "message": "zbl"}))
+
+    client = I2Client(serve_in_thread(fake_daemon), "wrong:access_key")
+    with pytest.raises(ConnectionError):
+        client.open()
+    assert client._loop is None
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_batch_inference(serve):
+    """Test inputs are packed in batches when the worker supports it."""
+
+    inputs = [f"input {i}" for i in range(7)]
+    sizes = []
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", batch_size=8) as client:
+            assert client._batch_size == 3
+            outputs = await client.async_inference(inputs, max_in_flight=2)
+            assert outputs == [(True, inp) for inp in inputs[:-1]] + [(False, "zbl")]
+        assert sizes == [3, 3, 1]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, features={"batch": 3})
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            if drecv["action"] == "BatchInference":
+                sizes.append(len(drecv["data"]))
+                data = [{"status": "Success", "data": d} for d in drecv["data"]]
+                msg = {"status": "Success", "data": data}
+            else:
+                sizes.append(1)
+                msg = {"status": "Fail", "message": "zbl"}
+            await websocket.send(msgpack.packb(msg))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_batch_inference_fallback(serve):
+    """Test inputs are sent one by one when the worker does not support batches."""
+
+    inputs = [f"input {i}" for i in range(3)]
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", batch_size=8) as client:
+            assert client._batch_size == 1
+            outputs = await client.async_inference(inputs)
+            assert outputs == [(True, inp) for inp in inputs]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            assert drecv["action"] == "Inference"
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_batch_inference_fail(serve):
+    """Test a failed or invalid batch response."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", batch_size=2) as client:
+            outputs = await client.async_inference(["a", "b"])
+            assert outputs == [(False, "zbl"), (False, "zbl")]
+            with pytest.raises(ValueError):
+                await client.async_inference(["a", "b"])
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, features={"batch": 2})
+        await websocket.recv()
+        await websocket.send(msgpack.packb({"status": "Fail", "message": "zbl"}))
+        await websocket.recv()
+        await websocket.send(msgpack.packb({"status": "Success", "data": ["a"]}))
+
+    await serve(fake_user, fake_daemon)
+
+
+async def echo_daemon(websocket, path):
+    """Fake daemon answering each inference with its input."""
+    await register(websocket)
+    async for recv in websocket:
+        drecv = msgpack.unpackb(recv)
+        await websocket.send(
+            msgpack.packb({"status": "Success", "data": drecv["data"]})
+        )
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_stream(serve):
+    """Test streaming sync and async sources, with bounded read-ahead."""
+
+    read = []
+
+    def source():
+        for i in range(20):
+            read.append(i)
+            yield f"input {i}"
+
+    async def async_source():
+        for i in range(5):
+            await asyncio.sleep(0.001)
+            yield i
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=3) as client:
+            count = 0
+            async for success, output in client.stream(source()):
+                assert success
+                assert output == f"input {count}"
+                # the window and the input queue bound what is read ahead
+                assert len(read) <= count + 1 + 2 * 3 + 1
+                count += 1
+            assert count == 20
+
+            outputs = [out async for out in client.stream(async_source())]
+            assert outputs == [(True, i) for i in range(5)]
+
+            print("Stop early, the connection stays in sync")
+            stream = client.stream(source())
+            async for success, output in stream:
+                break
+            await stream.aclose()
+            assert await client.async_inference("zbl") == [(True, "zbl")]
+
+    await serve(fake_user, echo_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_stream_errors(serve):
+    """Test errors of the source or the packing are raised by the stream."""
+
+    def source():
+        yield "a"
+        raise KeyError("zbl")
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=2) as client:
+            outputs = []
+            with pytest.raises(KeyError):
+                async for output in client.stream(source()):
+                    outputs.append(output)
+            assert outputs == [(True, "a")]
+
+            with pytest.raises(ValueError):
+                async for output in client.stream(["a", object()]):
+                    outputs.append(output)
+            assert outputs == [(True, "a"), (True, "a")]
+
+            with pytest.raises(ValueError):
+                async for output in client.stream(["a"], max_in_flight=0):
+                    pass
+
+    await serve(fake_user, echo_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_concurrent_users(serve):
+    """Test several coroutines can share one client."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=4) as client:
+
+            async def user(name):
+                inputs = [f"{name} {i}" for i in range(5)]
+                for inp in inputs:
+                    await asyncio.sleep(0.001)
+                    assert await client.async_inference(inp) == [(True, inp)]
+                assert await client.async_inference(inputs) == [
+                    (True, inp) for inp in inputs
+                ]
+
+            await asyncio.gather(*[user(name) for name in "abcdef"])
+
+    await serve(fake_user, echo_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_request_ids(serve):
+    """Test out-of-order responses are dispatched with their request id."""
+
+    inputs = [f"input {i}" for i in range(4)]
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=4) as client:
+            completed = [index async for index, _ in client.as_completed(inputs)]
+            assert completed == [3, 2, 1, 0]
+
+            outputs = await client.async_inference(inputs)
+            assert outputs == [(True, inp) for inp in inputs]
+
+            print("Cancelled request, late response discarded")
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.async_inference(inputs[:1]), 0.05)
+            assert await client.async_inference("zbl") == [(True, "zbl")]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, features={"request_id": True})
+
+        async def answer(drecv):
+            msg = {"status": "Success", "data": drecv["data"], "id": drecv["id"]}
+            await websocket.send(msgpack.packb(msg))
+
+        for _ in range(2):
+            # answer a window of requests in reverse order
+            received = [msgpack.unpackb(await websocket.recv()) for _ in range(4)]
+            for drecv in reversed(received):
+                await answer(drecv)
+
+        # one request answered too late, then a normal one
+        late = msgpack.unpackb(await websocket.recv())
+        await asyncio.sleep(0.1)
+        await answer(late)
+        await answer(msgpack.unpackb(await websocket.recv()))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_connection_lost(serve):
+    """Test pending requests fail when the connection is lost."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=2) as client:
+            with pytest.raises(ConnectionError):
+                await client.async_inference(["a", "b"])
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        await websocket.recv()
+        await websocket.close()
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_reconnect(serve):
+    """Test requests left without response are sent again after a reconnection."""
+
+    inputs = [f"input {i}" for i in range(6)]
+    connections = []
+
+    async def fake_user(url):
+        client = I2Client(
+            url,
+            "good:access_key",
+            max_in_flight=4,
+            reconnect=True,
+            reconnect_delay=0.01,
+        )
+        async with client:
+            outputs = await client.async_inference(inputs)
+            assert outputs == [(True, inp) for inp in inputs]
+            assert client.reconnects == 1
+            assert client.downtime > 0
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        connections.append(websocket)
+        if len(connections) == 1:
+            # answer one request, then drop the connection
+            drecv = msgpack.unpackb(await websocket.recv())
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+            await websocket.recv()
+            await websocket.close()
+            return
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_reconnect_fail(serve):
+    """Test pending requests fail when all reconnection attempts fail."""
+
+    registrations = []
+
+    async def fake_user(url):
+        client = I2Client(
+            url,
+            "good:access_key",
+            reconnect=True,
+            reconnect_attempts=3,
+            reconnect_delay=0.01,
+        )
+        async with client:
+            with pytest.raises(ConnectionError):
+                await client.async_inference("zbl")
+            assert client.reconnects == 0
+            with pytest.raises(ConnectionError):
+                await client.async_inference("zbl")
+        assert len(registrations) == 4
+
+    async def fake_daemon(websocket, path):
+        registrations.append(websocket)
+        if len(registrations) > 1:
+            await websocket.recv()
+            await websocket.send(msgpack.packb({"status": "Fail", "message": "zbl"}))
+            return
+        await register(websocket)
+        await websocket.recv()
+        await websocket.close()
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_reconnect_server_down(serve):
+    """Test reconnection attempts to a server that is down."""
+
+    servers = []
+
+    async def fake_user(url):
+        client = I2Client(
+            url,
+            "good:access_key",
+            reconnect=True,
+            reconnect_attempts=2,
+            reconnect_delay=0.01,
+        )
+        async with client:
+            servers[0].close()
+            with pytest.raises(ConnectionError):
+                await client.async_inference("zbl")
+
+    async def fake_daemon(websocket, path):
+        servers.append(websocket.ws_server)
+        await register(websocket)
+        await websocket.recv()
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", ["thread", "process", None])
+async def test_archipel_client_executor(serve, executor):
+    """Test encoding and decoding in a thread or process pool."""
+
+    fake_data = [np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)] * 4
+
+    async def fake_user(url):
+        client = I2Client(url, "good:access_key", max_in_flight=4, executor=executor)
+        async with client:
+            outputs = await client.async_inference(fake_data)
+            for (success, output), data in zip(outputs, fake_data):
+                assert success
+                assert np.array_equal(output, data)
+            with pytest.raises(ValueError):
+                await client.async_inference(object())
+        assert client._executor is None
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, "numpy.ndarray", "numpy.ndarray")
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+def test_archipel_client_invalid_executor():
+    """Test the default executor is a thread pool, and invalid executor name."""
+    assert I2Client("", "").executor == "thread"
+    with pytest.raises(ValueError):
+        I2Client("", "", executor="zbl")
+
+
+@pytest.mark.asyncio
+async def test_archipel_client_deadline(serve):
+    """Test requests missing their deadline fail, and their late outputs are dropped."""
+
+    missed = (False, "Deadline of 0.2s exceeded")
+
+    async def fake_user(url):
+        client = I2Client(url, "good:access_key", max_in_flight=4)
+        async with client:
+            assert await client.async_inference("slow", timeout=0.2) == [missed]
+            assert client.stats.deadline_misses == 1
+
+            # the late output does not shift the following ones
+            assert await client.async_inference("a") == [(True, "a")]
+            assert client.stats.late_responses == 1
+
+            source = ["b", "slow", "c"]
+            outputs = [
+                output
+                async for output in client.stream(source, max_in_flight=1, timeout=0.2)
+            ]
+            assert outputs == [(True, "b"), missed, (True, "c")]
+
+            with pytest.raises(ValueError):
+                await client.async_inference("a", timeout=0)
+
+        async with I2Client(url, "good:access_key", timeout=0.2) as client:
+            assert await client.async_inference("slow") == [missed]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            if drecv["data"] == "slow":
+                await asyncio.sleep(0.3)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+def test_archipel_client_invalid_timeout():
+    """Test invalid client-wide timeout."""
+    with pytest.raises(ValueError):
+        I2Client("", "", timeout=-1)
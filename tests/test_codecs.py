@@ -0,0 +1,134 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import archipel_utils as utils
+import cv2
+import msgpack
+import numpy as np
+import pytest
+from conftest import register
+
+from i2_client import I2Client
+from i2_client.codecs import decode_array, encode_array, encode_image, encode_raw
+
+
+def test_raw_codec():
+    """Test raw codec round trip through msgpack."""
+
+    arrays = [
+        np.random.randint(0, 255, (32, 24, 3), dtype=np.uint8),
+        np.random.rand(5, 7).astype(np.float32),
+        np.random.rand(8, 6).T,  # not contiguous
+        np.array(3, dtype=np.int64),
+        np.zeros((0, 3), dtype=np.float32),
+    ]
+    for array in arrays:
+        payload = encode_array(array, codecs=["raw"])
+        assert payload["codec"] == "raw"
+        unpacked = msgpack.unpackb(msgpack.packb(payload))
+        decoded = decode_array(unpacked)
+        assert decoded.dtype == array.dtype
+        assert np.array_equal(decoded, array)
+        assert not decoded.flags.writeable  # view on the received buffer
+
+    assert encode_raw(np.array([{}, None])) is None
+
+
+def test_default_serialization():
+    """Test fallback on archipel serialization."""
+
+    array = np.random.rand(5, 7)
+    assert encode_array(array) == utils.serialize_array(array)
+    assert np.array_equal(decode_array(utils.serialize_array(array)), array)
+
+    with pytest.raises(ValueError):
+        decode_array({"codec": "zbl"})
+
+
+@pytest.mark.asyncio
+async def test_client_raw_codec(serve):
+    """Test the raw codec is used when advertised by the worker."""
+
+    fake_data = np.random.randint(0, 255, (250, 250, 3), dtype=np.uint8)
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            ((success, output),) = await client.async_inference(fake_data)
+            assert success
+            assert np.array_equal(output, fake_data)
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"codecs": ["raw"]}
+        )
+        drecv = msgpack.unpackb(await websocket.recv())
+        assert drecv["data"]["codec"] == "raw"
+        await websocket.send(
+            msgpack.packb({"status": "Success", "data": drecv["data"]})
+        )
+
+    await serve(fake_user, fake_daemon)
+
+
+def test_image_codecs():
+    """Test image compression codecs."""
+
+    image = cv2.imread("examples/test.jpg")
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    for array in [image, gray, gray[:, :, None]]:
+        for codec in ["png", "webp", "jpeg"]:
+            payload = encode_array(array, codecs=[codec, "raw"], quality=95)
+            assert payload["codec"] == codec
+            assert len(payload["data"]) < array.nbytes
+            decoded = decode_array(msgpack.unpackb(msgpack.packb(payload)))
+            assert decoded.shape == array.shape
+            if codec == "png":
+                assert np.array_equal(decoded, array)
+            else:
+                assert np.abs(decoded.astype(int) - array).mean() < 5
+
+    print("Not an image, use next codec")
+    array = np.random.rand(8, 8, 3).astype(np.float32)
+    assert encode_array(array, codecs=["jpeg", "raw"])["codec"] == "raw"
+    rgba = np.zeros((8, 8, 4), dtype=np.uint8)
+    assert encode_array(rgba, codecs=["jpeg", "png"])["codec"] == "png"
+    assert encode_image(np.zeros((8, 8, 2), dtype=np.uint8), codec="png") is None
+
+    with pytest.raises(ValueError):
+        decode_array({"codec": "png", "shape": [1], "data": b"zbl"})
+
+
+@pytest.mark.asyncio
+async def test_client_image_codec(serve):
+    """Test the client picks its preferred codec among the advertised ones."""
+
+    image = cv2.imread("examples/test.jpg")
+
+    async def fake_user(url):
+        codecs = ("png", "jpeg", "raw")
+        async with I2Client(url, "good:access_key", codecs=codecs) as client:
+            ((success, output),) = await client.async_inference(image)
+            assert success
+            assert output.shape == image.shape
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket,
+            "numpy.ndarray",
+            "numpy.ndarray",
+            features={"codecs": ["raw", "webp", "jpeg"]},
+        )
+        drecv = msgpack.unpackb(await websocket.recv())
+        assert drecv["data"]["codec"] == "jpeg"
+        await websocket.send(
+            msgpack.packb({"status": "Success", "data": drecv["data"]})
+        )
+
+    await serve(fake_user, fake_daemon)
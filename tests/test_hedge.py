@@ -0,0 +1,104 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import time
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import HedgedClient
+from i2_client.hedge import MIN_SAMPLES
+
+
+def test_init():
+    """Test hedged client initialization and hedge delay."""
+
+    client = HedgedClient(["a", "b", "c"], "", hedge_delay=0.5, min_hedge_delay=0.01)
+    assert len(client.clients) == 3
+    assert client.hedge_delay == 0.5
+    assert client.hedge_rate == 0.0
+
+    client.latencies.extend([0.001] * MIN_SAMPLES)
+    assert client.hedge_delay == 0.01
+    client.latencies.extend([0.1 * i for i in range(1, 101)])
+    assert client.hedge_delay == pytest.approx(9.4)
+
+    with pytest.raises(ValueError):
+        HedgedClient(["a"], "")
+    with pytest.raises(ValueError):
+        HedgedClient(["a", "b"], "", hedge_percentile=100)
+
+
+@pytest.mark.asyncio
+async def test_hedged_inference(serve):
+    """Test slow calls are sent to a second endpoint, and the first output wins."""
+
+    received = []
+
+    async def fake_user(url):
+        urls = [f"{url}/slow", f"{url}/fast"]
+        async with HedgedClient(urls, "good:access_key", hedge_delay=0.1) as client:
+            start = time.perf_counter()
+            assert await client.async_inference("a") == [(True, "a")]
+            assert time.perf_counter() - start < 0.5
+            assert client.hedges == client.hedge_wins == 1
+            assert received == [("/slow", "a"), ("/fast", "a")]
+
+            # not hedged when answered in time
+            assert await client.async_inference("b") == [(True, "b")]
+            assert client.hedges == 1
+            assert client.hedge_rate == 0.5
+            assert client.loads == [0, 0]
+            assert received[-1] == ("/fast", "b")  # the slow one is still busy
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append((path, drecv["data"]))
+            if path == "/slow" and drecv["data"] == "a":
+                await asyncio.sleep(1)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_hedged_failover(serve):
+    """Test a call failing with a connection error is sent to another endpoint."""
+
+    async def fake_user(url):
+        urls = [f"{url}/down", f"{url}/up"]
+        async with HedgedClient(urls, "good:access_key", hedge_delay=10) as client:
+            assert await client.async_inference("a") == [(True, "a")]
+            assert client.failovers == 1
+            assert client.hedges == 0
+
+        urls = [f"{url}/down", f"{url}/down"]
+        async with HedgedClient(urls, "good:access_key", hedge_delay=10) as client:
+            with pytest.raises(ConnectionError):
+                await client.async_inference("a")
+            assert client.failovers == 1
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            if path == "/down":
+                await websocket.close()
+                return
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
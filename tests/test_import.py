@@ -0,0 +1,56 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import subprocess  # nosec
+import sys
+
+import pytest
+
+import i2_client
+
+
+def _imported(code: str) -> set:
+    """Top-level packages imported by code in a fresh interpreter (-X importtime)."""
+
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = [line for line in result.stderr.splitlines() if "|" in line]
+    return {line.split("|")[-1].strip().split(".")[0] for line in lines[1:]}
+
+
+@pytest.mark.parametrize(
+    "code,forbidden",
+    [
+        ("import i2_client", ["numpy", "click", "rich", "websockets", "cv2"]),
+        ("from i2_client import I2Client", ["click", "docker", "cv2", "rich"]),
+        ("from i2_client import i2_cli", ["numpy", "docker", "cv2", "rich"]),
+        (
+            "from i2_client import i2_cli; i2_cli(['--help'], standalone_mode=False)",
+            ["numpy", "docker", "cv2", "websockets"],
+        ),
+    ],
+)
+def test_lazy_imports(code, forbidden):
+    """Test the client and the CLI only import what they use."""
+    imported = _imported(code)
+    assert not imported.intersection(forbidden)
+
+
+def test_lazy_attributes():
+    """Test the public names are importable and listed."""
+
+    assert {"I2Client", "I2ClientPool", "i2_cli"}.issubset(dir(i2_client))
+    assert i2_client.I2Client.__name__ == "I2Client"
+    assert i2_client.i2_cli is i2_client.i2_cli
+    with pytest.raises(AttributeError):
+        i2_client.zbl
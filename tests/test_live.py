@@ -0,0 +1,158 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client, LiveSource
+from i2_client.live import AdaptiveRate, Pacer
+
+
+def test_pacer():
+    """Test the pacer sleeps on a fixed schedule, and can be interrupted."""
+
+    with pytest.raises(ValueError):
+        Pacer(0)
+
+    pacer = Pacer(50)
+    start = time.monotonic()
+    for _ in range(11):
+        assert pacer.wait()
+    assert 0.18 < time.monotonic() - start < 0.3
+
+    stop = threading.Event()
+    stop.set()
+    start = time.monotonic()
+    assert not Pacer(1).wait(stop)
+    assert not pacer.wait(stop)
+    assert time.monotonic() - start < 0.1
+
+
+def test_adaptive_rate():
+    """Test the rate follows the latency, within its bounds."""
+
+    with pytest.raises(ValueError):
+        AdaptiveRate(10, min_rate=20)
+
+    controller = AdaptiveRate(30, min_rate=2, headroom=1, smoothing=0.5)
+    assert controller.rate == 30
+    assert controller.update(0.01) == 30
+    assert controller.update(0.19) == 10  # smoothed latency of 0.1s
+    for _ in range(20):
+        controller.update(10)
+    assert controller.rate == 2
+    for _ in range(20):
+        controller.update(0.05)
+    assert controller.rate == pytest.approx(20, rel=0.01)
+
+    assert AdaptiveRate(30, in_flight=2, headroom=1).update(0.1) == 20
+
+
+async def _slow_daemon(websocket, path):
+    """Fake daemon taking 50ms per frame."""
+
+    await register(websocket)
+    async for recv in websocket:
+        drecv = msgpack.unpackb(recv)
+        await asyncio.sleep(0.05)
+        await websocket.send(
+            msgpack.packb({"status": "Success", "data": drecv["data"]})
+        )
+
+
+@pytest.mark.asyncio
+async def test_live_source(serve):
+    """Test the capture rate is lowered to the worker one, and outputs displayed."""
+
+    async def fake_user(url):
+        frames = itertools.count()
+        displayed = []
+        display_threads = set()
+
+        def display(frame, output):
+            display_threads.add(threading.current_thread().name)
+            displayed.append((frame, output))
+            return len(displayed) < 20
+
+        async with I2Client(url, "good:access_key") as client:
+            source = LiveSource(
+                client, lambda: (True, next(frames)), display, max_fps=100
+            )
+            await source.run()
+
+        assert display_threads == {"i2-display"}
+        assert all(output == (True, frame) for frame, output in displayed)
+        assert [frame for frame, _ in displayed] == sorted(f for f, _ in displayed)
+        assert source.displayed == 20
+
+        # about 18 fps for a 50ms worker, instead of 100
+        assert source.fps < 25
+        assert source.captured == source.stream.submitted
+        assert source.stream.dropped < source.captured / 2
+
+    await serve(fake_user, _slow_daemon)
+
+
+@pytest.mark.asyncio
+async def test_live_source_stop(serve):
+    """Test stopping while the capture waits for a frame is not an error."""
+
+    async def fake_user(url):
+        frames = itertools.count()
+
+        def read():
+            time.sleep(0.03)  # like a camera waiting for its next frame
+            return True, next(frames)
+
+        async with I2Client(url, "good:access_key") as client:
+            for _ in range(5):
+                source = LiveSource(
+                    client, read, lambda *_: source.displayed < 3, max_fps=100
+                )
+                await source.run()
+                assert source.displayed == 3
+                assert source.error is None
+                assert source.captured == source.stream.submitted
+
+    await serve(fake_user, _slow_daemon)
+
+
+@pytest.mark.asyncio
+async def test_live_source_end(serve):
+    """Test the end of the source, or an error, stops the stream."""
+
+    async def fake_user(url):
+        frames = iter(range(5))
+
+        def read():
+            frame = next(frames, None)
+            return frame is not None, frame
+
+        async with I2Client(url, "good:access_key") as client:
+            source = LiveSource(client, read, max_fps=50, adaptive=False)
+            await source.run()
+            assert source.captured == 5
+            assert source.fps == 50
+
+            def fail():
+                raise OSError("camera unplugged")
+
+            with pytest.raises(OSError):
+                await LiveSource(client, fail).run()
+
+        with pytest.raises(ValueError):
+            LiveSource(client, read, max_in_flight=0)
+
+    await serve(fake_user, _slow_daemon)
@@ -0,0 +1,75 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2ClientPool
+
+
+def test_init():
+    """Test pool initialization."""
+    pool = I2ClientPool("", "", size=3)
+    assert len(pool.clients) == 3
+
+    with pytest.raises(ValueError):
+        I2ClientPool("", "", size=0)
+
+
+@pytest.mark.asyncio
+async def test_pool_inference(serve):
+    """Test inferences are spread over connections and keep the input order."""
+
+    inputs = [f"input {i}" for i in range(9)]
+    connections = []
+
+    async def fake_user(url):
+        async with I2ClientPool(url, "good:access_key", size=3) as pool:
+            outputs = await pool.async_inference(inputs)
+            assert outputs == [(True, inp) for inp in inputs]
+            assert pool.loads == [0, 0, 0]
+        assert connections == [3, 3, 3]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        conn = len(connections)
+        connections.append(0)
+        async for recv in websocket:
+            connections[conn] += 1
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_pool_connection_fail(serve):
+    """Test the pool fails if one of the connection is refused."""
+
+    registrations = []
+
+    async def fake_user(url):
+        with pytest.raises(ConnectionError):
+            async with I2ClientPool(url, "good:access_key", size=2):
+                pass
+
+    async def fake_daemon(websocket, path):
+        await websocket.recv()
+        registrations.append(websocket)
+        status = "Success" if len(registrations) == 1 else "Fail"
+        data = {"input_type": "str", "output_type": "str"}
+        await websocket.send(
+            msgpack.packb({"status": status, "data": data, "message": "zbl"})
+        )
+        await websocket.wait_closed()
+
+    await serve(fake_user, fake_daemon)
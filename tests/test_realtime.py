@@ -0,0 +1,128 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import threading
+import time
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client, RealtimeStream
+
+
+def test_init():
+    """Test realtime stream initialization."""
+
+    client = I2Client("", "")
+    stream = client.realtime()
+    assert isinstance(stream, RealtimeStream)
+    with pytest.raises(RuntimeError):
+        stream.submit("frame")
+
+    with pytest.raises(ValueError):
+        client.realtime(max_in_flight=0)
+    with pytest.raises(ValueError):
+        client.realtime(priority="zbl")
+
+
+async def _slow_daemon(websocket, path):
+    """Fake daemon taking 50ms per frame."""
+
+    await register(websocket)
+    async for recv in websocket:
+        drecv = msgpack.unpackb(recv)
+        await asyncio.sleep(0.05)
+        await websocket.send(
+            msgpack.packb({"status": "Success", "data": drecv["data"]})
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_in_flight", [1, 2])
+async def test_realtime_stream(serve, max_in_flight):
+    """Test stale frames are dropped, and the latency stays bounded."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=2) as client:
+            async with client.realtime(max_in_flight=max_in_flight) as stream:
+
+                async def _consume():
+                    return [output async for output in stream.outputs()]
+
+                consumer = asyncio.ensure_future(_consume())
+                for i in range(40):
+                    stream.submit(i)
+                    await asyncio.sleep(0.01)
+
+                while stream.completed + stream.dropped < 40:
+                    await asyncio.sleep(0.01)
+
+            outputs = await consumer
+            frames = [frame for frame, _ in outputs]
+            assert all(output == (True, frame) for frame, output in outputs)
+            assert frames == sorted(frames)
+            assert frames[-1] == 39
+
+            assert not stream.submit(40)  # closed
+            assert stream.submitted == 40
+            assert stream.dropped > 20
+            assert stream.completed == 40 - stream.dropped
+            assert max(stream.latencies) < 0.05 * (max_in_flight + 2)
+
+    await serve(fake_user, _slow_daemon)
+
+
+@pytest.mark.asyncio
+async def test_realtime_stream_thread(serve):
+    """Test frames submitted from a capture thread."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            async with client.realtime() as stream:
+
+                def _capture():
+                    for i in range(10):
+                        stream.submit(i)
+                        time.sleep(0.1)
+
+                thread = threading.Thread(target=_capture)
+                thread.start()
+                frames = []
+                async for frame, output in stream.outputs():
+                    frames.append(frame)
+                    if frame == 9:
+                        break
+                thread.join()
+
+            assert frames == list(range(10))
+            assert stream.dropped == 0
+            assert 0 < stream.latency < 0.1
+
+    await serve(fake_user, _slow_daemon)
+
+
+@pytest.mark.asyncio
+async def test_realtime_stream_connection_lost(serve):
+    """Test the loss of the connection ends the outputs with an error."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            async with client.realtime() as stream:
+                stream.submit("frame")
+                with pytest.raises(ConnectionError):
+                    async for _ in stream.outputs():
+                        pass
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        await websocket.recv()
+
+    await serve(fake_user, fake_daemon)
@@ -0,0 +1,142 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import time
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client, I2ClientPool
+from i2_client.scheduler import SendGate, TokenBucket
+
+
+def test_token_bucket():
+    """Test bursts and refill of the token bucket."""
+
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0.0] * 3
+    assert 0.05 < bucket.take() <= 0.1
+
+    assert TokenBucket(rate=0.5).burst == 1
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, burst=0)
+
+
+@pytest.mark.asyncio
+async def test_send_gate_priorities():
+    """Test waiting requests are granted by priority, then in arrival order."""
+
+    gate = SendGate(1)
+    granted = []
+
+    async def _acquire(name, priority):
+        await gate.acquire(priority)
+        granted.append(name)
+
+    await gate.acquire("bulk")
+    tasks = [
+        asyncio.ensure_future(_acquire(name, priority))
+        for name, priority in [
+            ("bulk", "bulk"),
+            ("normal", "normal"),
+            ("cancelled", "realtime"),
+            ("realtime 1", "realtime"),
+            ("realtime 2", "realtime"),
+        ]
+    ]
+    await asyncio.sleep(0)
+    assert gate.waiting == 5
+
+    tasks[2].cancel()
+    for _ in range(4):
+        gate.release()
+        await asyncio.sleep(0)
+
+    assert granted == ["realtime 1", "realtime 2", "normal", "bulk"]
+    assert gate.granted == {"bulk": 2, "normal": 1, "realtime": 2}
+    assert gate.queued == {"bulk": 1, "normal": 1, "realtime": 3}
+
+    with pytest.raises(ValueError):
+        await gate.acquire("zbl")
+
+
+@pytest.mark.asyncio
+async def test_send_gate_rate_limit():
+    """Test the rate of the grants stays within the token bucket."""
+
+    gate = SendGate(100, TokenBucket(rate=50, burst=2))
+    start = time.perf_counter()
+    for _ in range(7):
+        await gate.acquire()
+    assert 0.09 < time.perf_counter() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_client_priorities(serve):
+    """Test realtime inputs are sent before the bulk ones queued before them."""
+
+    received = []
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", rate_limit=100) as client:
+            bulk = asyncio.ensure_future(
+                client.async_inference([f"bulk {i}" for i in range(4)], priority="bulk")
+            )
+            await asyncio.sleep(0.005)
+            realtime = await client.async_inference("realtime", priority="realtime")
+            assert realtime == [(True, "realtime")]
+            await bulk
+
+            assert received.index("realtime") < 3
+            assert client.gate.queued["realtime"] == 1
+            assert client.stats.summary()["queue"]["max"] > 0
+
+            with pytest.raises(ValueError):
+                await client.async_inference("a", priority="zbl")
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            await asyncio.sleep(0.01)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_pool_rate_limit(serve):
+    """Test the clients of a pool share its rate limit."""
+
+    async def fake_user(url):
+        async with I2ClientPool(url, "good:access_key", size=2, rate_limit=20) as pool:
+            buckets = {id(client.rate_limit) for client in pool.clients}
+            assert len(buckets) == 1
+
+            start = time.perf_counter()
+            outputs = await pool.async_inference(list(range(25)), priority="bulk")
+            assert outputs == [(True, i) for i in range(25)]
+            assert time.perf_counter() - start > 0.2
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
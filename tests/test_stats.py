@@ -0,0 +1,107 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import threading
+
+import msgpack
+import numpy as np
+import pytest
+from conftest import register
+
+from i2_client import I2Client
+from i2_client.stats import PHASES, SIZES, ClientStats, RequestTiming, percentile
+
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_client_stats():
+    """Test recording and summary of request timings."""
+
+    stats = ClientStats(history=3)
+    assert stats.summary()["total"]["p99"] == 0.0
+
+    for i in range(5):
+        timing = RequestTiming(size=2)
+        timing.total = float(i)
+        timing.bytes_sent = 10
+        stats.record(timing)
+
+    assert stats.requests == 5
+    assert stats.inputs == 10
+    assert stats.bytes_sent == 50
+    assert len(stats.timings) == 3
+
+    summary = stats.summary(percentiles=[50, 99.9])
+    assert set(summary) == set(PHASES + SIZES)
+    assert summary["total"] == {"mean": 3.0, "max": 4.0, "p50": 3.0, "p99.9": 4.0}
+    assert "total=4.000000" in repr(stats.timings[-1])
+
+    stats.reset()
+    assert stats.requests == 0 and len(stats.timings) == 0
+
+
+def test_client_stats_thread():
+    """Test the summary can be read while requests are recorded in another thread."""
+
+    stats = ClientStats(history=100)
+    stop = threading.Event()
+
+    def _record():
+        while not stop.is_set():
+            stats.record(RequestTiming())
+
+    thread = threading.Thread(target=_record)
+    thread.start()
+    try:
+        for _ in range(200):
+            stats.summary()
+    finally:
+        stop.set()
+        thread.join()
+
+
+@pytest.mark.asyncio
+async def test_client_instrumentation(serve):
+    """Test the client records the timing of each request."""
+
+    fake_data = np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)
+    timings = []
+
+    async def fake_user(url):
+        client = I2Client(url, "good:access_key", on_request=timings.append)
+        async with client:
+            await client.async_inference([fake_data, fake_data])
+
+        assert len(timings) == 2
+        assert client.stats.requests == 2
+        for timing in timings:
+            assert timing.bytes_sent > fake_data.nbytes
+            assert timing.bytes_received > fake_data.nbytes
+            assert timing.wait > 0
+            assert timing.total >= timing.encode + timing.send + timing.decode
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"codecs": ["raw"]}
+        )
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
@@ -0,0 +1,113 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import socket
+
+import msgpack
+import pytest
+from conftest import register
+
+from i2_client import I2Client
+from i2_client.transport import AUTO_PROFILES, PROFILES, transport_options
+
+
+def test_transport_options():
+    """Test profiles and custom options."""
+
+    assert transport_options("throughput")["compression"] is None
+    assert transport_options({"ping_interval": None}) == {"ping_interval": None}
+    assert set(AUTO_PROFILES).issubset(PROFILES)
+
+    with pytest.raises(ValueError):
+        transport_options("zbl")
+    with pytest.raises(ValueError):
+        transport_options({"zbl": 1})
+    with pytest.raises(ValueError):
+        I2Client("", "", transport="zbl")
+
+
+@pytest.mark.asyncio
+async def test_client_transport_profiles(serve):
+    """Test the compression and TCP_NODELAY of the profiles."""
+
+    extensions = []
+
+    async def fake_user(url):
+        for profile, nodelay in [("default", 1), ("constrained-bandwidth", 0)]:
+            async with I2Client(url, "good:access_key", transport=profile) as client:
+                assert await client.async_inference("a") == [(True, "a")]
+                sock = client.websocket.transport.get_extra_info("socket")
+                assert (
+                    sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) == nodelay
+                )
+
+        async with I2Client(url, "good:access_key", transport="throughput") as client:
+            assert client.websocket.ping_interval == 20
+            assert await client.async_inference("a") == [(True, "a")]
+
+        options = {"compression": None, "ping_interval": None}
+        async with I2Client(url, "good:access_key", transport=options) as client:
+            assert client.websocket.ping_interval is None
+            assert client.profile == "custom"
+
+        assert ["permessage-deflate" in ext for ext in extensions] == [
+            True,
+            True,
+            False,
+            False,
+        ]
+
+    async def fake_daemon(websocket, path):
+        extensions.append(websocket.request_headers.get("Sec-WebSocket-Extensions", ""))
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+async def test_client_auto_transport(serve):
+    """Test the auto transport probes each profile once and keeps the fastest."""
+
+    received = []
+
+    async def fake_user(url):
+        with pytest.raises(ValueError):
+            I2Client(url, "good:access_key", transport="auto")
+
+        client = I2Client(url, "good:access_key", transport="auto", probe_input="p")
+        async with client:
+            assert set(client.probe_results) == set(AUTO_PROFILES)
+            assert client.probe_results[client.profile] == min(
+                client.probe_results.values()
+            )
+            assert await client.async_inference("a") == [(True, "a")]
+
+        # not probed again on the next connection
+        profile = client.profile
+        async with client:
+            assert await client.async_inference("b") == [(True, "b")]
+        assert client.profile == profile
+
+        assert received == ["p"] * 3 * len(AUTO_PROFILES) + ["a", "b"]
+
+    async def fake_daemon(websocket, path):
+        await register(websocket)
+        async for recv in websocket:
+            drecv = msgpack.unpackb(recv)
+            received.append(drecv["data"])
+            await websocket.send(
+                msgpack.packb({"status": "Success", "data": drecv["data"]})
+            )
+
+    await serve(fake_user, fake_daemon)
@@ -0,0 +1,121 @@
+"""Copyright (C) Square Factory SA - All Rights Reserved.
+
+This source code is protected under international copyright law. All rights
+reserved and protected by the copyright holders.
+This file is confidential and only available to authorized individuals with the
+permission of the copyright holders. If you encounter this file and do not have
+permission, please contact the copyright holders and delete this file.
+"""
+
+import asyncio
+import random
+
+import cv2
+import msgpack
+import numpy as np
+import pytest
+from conftest import register
+
+from i2_client import I2Client
+from i2_client.video import async_process_video
+
+FRAMES = 20
+
+
+@pytest.fixture
+def video(tmp_path):
+    """A small video, each frame a bit brighter than the previous one."""
+
+    path = str(tmp_path / "source.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), 10 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def _read(path):
+    """Frame rate and frames of a video."""
+
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return fps, frames
+
+
+@pytest.mark.asyncio
+async def test_process_video(serve, video, tmp_path):
+    """Test frames are processed out of order, and written in order."""
+
+    output_path = str(tmp_path / "output.mp4")
+    progress = []
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key", max_in_flight=4) as client:
+            info = await async_process_video(
+                client,
+                video,
+                output_path,
+                max_in_flight=4,
+                on_frame=lambda count, _: progress.append(count),
+            )
+        assert info.frames == FRAMES
+        assert (info.width, info.height, info.fps) == (64, 48, 10)
+        assert progress == list(range(1, FRAMES + 1))
+
+        fps, frames = _read(output_path)
+        assert fps == 10
+        assert len(frames) == FRAMES
+        assert all(frame.shape == (48, 64, 3) for frame in frames)
+        # lossy codec, but the order is kept
+        means = [frame.mean() for frame in frames]
+        assert np.all(np.diff(means) > 0)
+        assert np.allclose(means, [10 * i for i in range(FRAMES)], atol=8)
+
+    async def fake_daemon(websocket, path):
+        await register(
+            websocket, "numpy.ndarray", "numpy.ndarray", features={"request_id": True}
+        )
+
+        async def answer(drecv):
+            await asyncio.sleep(random.uniform(0, 0.02))  # nosec
+            msg = {"status": "Success", "data": drecv["data"], "id": drecv["id"]}
+            await websocket.send(msgpack.packb(msg))
+
+        async for recv in websocket:
+            asyncio.ensure_future(answer(msgpack.unpackb(recv)))
+
+    await serve(fake_user, fake_daemon)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "response, error",
+    [
+        ({"status": "Failure", "message": "zbl"}, RuntimeError),
+        ({"status": "Success", "data": "not an image"}, ValueError),
+    ],
+)
+async def test_process_video_errors(serve, video, tmp_path, response, error):
+    """Test failed inferences and invalid outputs stop the processing."""
+
+    async def fake_user(url):
+        async with I2Client(url, "good:access_key") as client:
+            with pytest.raises(error):
+                await async_process_video(client, video, str(tmp_path / "out.mp4"))
+
+            with pytest.raises(ValueError):
+                await async_process_video(client, "zbl.mp4", str(tmp_path / "out.mp4"))
+
+    async def fake_daemon(websocket, path):
+        await register(websocket, "numpy.ndarray", "str")
+        async for _ in websocket:
+            await websocket.send(msgpack.packb(response))
+
+    await serve(fake_user, fake_daemon)